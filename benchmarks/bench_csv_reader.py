@@ -0,0 +1,27 @@
+# Comparaison de la lecture CSV historique (sep=None, moteur python) avec
+# pony_express.readers.read_csv_fast : temps de chargement et pic mémoire.
+#
+# La génération du fichier et chaque lecture sont exécutées dans des
+# processus séparés (voir harness.py).
+#
+#   python benchmarks/bench_csv_reader.py --rows 1000000
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pony_express.readers import read_csv_fast, used_columns  # noqa: E402
+from harness import main  # noqa: E402
+from synthetic import generate_csv  # noqa: E402
+
+READERS = {
+    "historique": lambda path: pd.read_csv(path, sep=None, engine="python"),
+    "rapide-c": lambda path: read_csv_fast(path, used_columns("sortante"), engine="c"),
+    "rapide-pyarrow": lambda path: read_csv_fast(path, used_columns("sortante"), engine="pyarrow"),
+}
+
+
+if __name__ == "__main__":
+    main(__file__, READERS, generate_csv, "export.csv", "Fichier", default_rows=1_000_000)
@@ -0,0 +1,42 @@
+# Comparaison de la lecture Excel historique (pd.read_excel sur tout le
+# classeur) avec pony_express.readers.read_excel_chunks : temps de chargement
+# et pic mémoire, pour chacun des moteurs disponibles.
+#
+# Comme pour bench_csv_reader.py, la génération du classeur et chaque lecture
+# sont exécutées dans des processus séparés (voir harness.py).
+#
+#   python benchmarks/bench_excel_reader.py --rows 100000
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pony_express.readers import python_calamine, read_excel_chunks, used_columns  # noqa: E402
+from harness import main  # noqa: E402
+from synthetic import generate_frame, write_export  # noqa: E402
+
+CHUNKSIZE = 100_000
+
+
+def _read_streaming(path, backend):
+    columns, chunks = read_excel_chunks(path, path, used_columns("sortante"), CHUNKSIZE, backend)
+    return pd.concat(list(chunks), ignore_index=True)
+
+
+READERS = {
+    "historique": lambda path: pd.read_excel(path),
+    "rapide-openpyxl": lambda path: _read_streaming(path, "openpyxl"),
+}
+if python_calamine is not None:
+    READERS["rapide-calamine"] = lambda path: _read_streaming(path, "calamine")
+
+
+# Fonction pour générer un classeur synthétique
+def generate_xlsx(path, rows, extra_columns, seed=0):
+    write_export(generate_frame(rows, extra_columns=extra_columns, seed=seed), path)
+
+
+if __name__ == "__main__":
+    main(__file__, READERS, generate_xlsx, "export.xlsx", "Classeur", default_rows=100_000)
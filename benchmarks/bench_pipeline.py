@@ -0,0 +1,201 @@
+# Benchmark du parcours d'un onglet, étape par étape : chargement du fichier,
+# cascade de filtres (année, pays, région), synthèse et exports CSV / Excel,
+# pour les schémas sortante et entrante.
+#
+# Chaque cas (schéma, format, taille) est exécuté dans un processus séparé,
+# comme la génération des fichiers : le pic de mémoire résidente est hérité du
+# processus parent. Le pic mémoire du chargement est la hausse de ce pic ;
+# celui des étapes suivantes est le pic des allocations suivies par
+# tracemalloc, mesuré lors d'une seconde exécution de l'étape pour ne pas
+# fausser le temps. Les résultats sont écrits en JSON et deux fichiers de
+# résultats (deux versions de l'application) peuvent être comparés :
+#
+#   python benchmarks/bench_pipeline.py --rows 10000 100000 -o avant.json
+#   python benchmarks/bench_pipeline.py --rows 10000 100000 -o apres.json
+#   python benchmarks/bench_pipeline.py --compare avant.json apres.json
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pony_express.cube import CountsCube  # noqa: E402
+from pony_express.export import EXPORT_FORMATS, display_frame  # noqa: E402
+from pony_express.index import QueryIndex  # noqa: E402
+from pony_express.ingest import DEFAULT_CHUNKSIZE, DEFAULT_MIN_YEAR, ingest  # noqa: E402
+from synthetic import export_name, generate_frame, write_export  # noqa: E402
+
+# Nombre de pays sélectionnés dans la cascade de filtres
+SELECTED_COUNTRIES = 5
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stage(name, elapsed, peak_mb, rows_in, rows_out):
+    return {"etape": name, "secondes": elapsed, "pic_mo": peak_mb, "lignes_entree": rows_in, "lignes_sortie": rows_out}
+
+
+# Fonction pour chronométrer une étape, puis mesurer ses allocations lors
+# d'une seconde exécution
+def _measure(fn, memory=True):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+# Cascade de filtres de l'onglet : options des menus, « France entière »
+# sur plusieurs pays puis chacune des régions proposées
+def filter_cascade(df):
+    index = QueryIndex(df)
+    if not index.years:
+        return df.iloc[:0]
+    year = index.years[0]
+    countries = index.countries(year)[:SELECTED_COUNTRIES]
+    selection = index.select(df, year, countries)
+    for region in index.regions(year, countries):
+        index.select(df, year, countries, region)
+    return selection
+
+
+def summary(df):
+    cube = CountsCube(df)
+    for year in cube.by_year.index:
+        cube.year_totals(year)
+        cube.pivot(year, "sirets")
+    return cube
+
+
+def run_case(path, type_mobilite, min_year, memory=True):
+    stages = []
+    base_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    df, report = ingest(path, os.path.basename(path), type_mobilite=type_mobilite, min_year=min_year,
+                        chunksize=DEFAULT_CHUNKSIZE)
+    stages.append(_stage("chargement", time.perf_counter() - start, _peak_rss_mb() - base_rss,
+                         report["lignes_lues"], len(df)))
+
+    selection, elapsed, peak = _measure(lambda: filter_cascade(df), memory)
+    stages.append(_stage("filtres", elapsed, peak, len(df), len(selection)))
+
+    _, elapsed, peak = _measure(lambda: summary(df), memory)
+    stages.append(_stage("synthese", elapsed, peak, len(df), None))
+
+    display_df = display_frame(selection)
+    for fmt, (_, _, convert) in EXPORT_FORMATS.items():
+        data, elapsed, peak = _measure(lambda: convert(display_df), memory)
+        stages.append(_stage(f"export_{fmt}", elapsed, peak, len(display_df), len(data)))
+    return stages
+
+
+def _git_version():
+    try:
+        out = subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    def _key(result):
+        return result["type_mobilite"], result["format"], result["lignes"], result["etape"]
+
+    before = {_key(result): result for result in old["resultats"]}
+    print(f"{old.get('version')} -> {new.get('version')}")
+    for result in new["resultats"]:
+        previous = before.get(_key(result))
+        if previous is None:
+            continue
+        ratio = result["secondes"] / previous["secondes"] if previous["secondes"] else float("nan")
+        print(f"{'/'.join(str(part) for part in _key(result)):>40} : "
+              f"{previous['secondes']:8.3f} s -> {result['secondes']:8.3f} s  (x{ratio:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chargement -> filtres -> export.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--types", nargs="+", choices=["sortante", "entrante"], default=["sortante", "entrante"])
+    parser.add_argument("--annee-min", type=int, default=DEFAULT_MIN_YEAR)
+    parser.add_argument("--data", default=os.path.join(ROOT, "benchmarks", "data"),
+                        help="Dossier des exports générés (réutilisés d'une exécution à l'autre)")
+    parser.add_argument("--no-memory", action="store_true", help="Ne pas mesurer les allocations (plus rapide)")
+    parser.add_argument("-o", "--output", help="Fichier JSON des résultats")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"))
+    parser.add_argument("--case", nargs=2, metavar=("PATH", "TYPE"), help=argparse.SUPPRESS)
+    parser.add_argument("--generate", nargs="+", metavar="ARG", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.case:
+        print(json.dumps(run_case(*args.case, min_year=args.annee_min, memory=not args.no_memory)))
+        return
+    if args.generate:
+        type_mobilite, rows, *paths = args.generate
+        frame = generate_frame(int(rows), type_mobilite)
+        for path in paths:
+            write_export(frame, path)
+        return
+
+    os.makedirs(args.data, exist_ok=True)
+    results = []
+    for type_mobilite in args.types:
+        for rows in args.rows:
+            paths = {fmt: os.path.join(args.data, export_name(type_mobilite, rows, fmt)) for fmt in args.formats}
+            missing = [path for path in paths.values() if not os.path.exists(path)]
+            if missing:
+                subprocess.run([sys.executable, __file__, "--generate", type_mobilite, str(rows)] + missing, check=True)
+
+            for fmt, path in paths.items():
+                command = [sys.executable, __file__, "--case", path, type_mobilite, "--annee-min", str(args.annee_min)]
+                if args.no_memory:
+                    command.append("--no-memory")
+                out = subprocess.run(command, check=True, capture_output=True, text=True)
+                for stage in json.loads(out.stdout):
+                    results.append({"type_mobilite": type_mobilite, "format": fmt, "lignes": rows, **stage})
+                    peak = "" if stage["pic_mo"] is None else f"pic {stage['pic_mo']:7.1f} Mo"
+                    print(f"{type_mobilite:>9} {fmt:>4} {rows:>8} {stage['etape']:>12} : "
+                          f"{stage['secondes']:8.3f} s  {peak}")
+
+    document = {
+        "version": _git_version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plateforme": platform.platform(),
+        "annee_min": args.annee_min,
+        "resultats": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Harnais commun des comparaisons de lecteurs (bench_csv_reader.py,
+# bench_excel_reader.py) : chaque script ne fournit que sa table de lecteurs
+# et sa fonction de génération.
+#
+# La génération du fichier et chaque lecture sont exécutées dans des
+# processus séparés : le pic de mémoire résidente (ru_maxrss) est hérité du
+# processus parent sous Linux et fausserait sinon les mesures. Le script
+# appelant est relancé avec les options internes --generate et --measure.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Fonction pour mesurer une lecture (exécutée dans le processus fils)
+def measure(read, path):
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = read(path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "secondes": elapsed,
+        "pic_mo": (peak_rss - base_rss) / 1024,
+        "lignes": len(df),
+        "colonnes": len(df.columns),
+    }))
+
+
+# Fonction pour générer le fichier puis mesurer chaque lecteur dans son
+# propre processus
+def main(script, readers, generate, filename, label, default_rows):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=default_rows)
+    parser.add_argument("--extra-columns", type=int, default=40)
+    parser.add_argument("--measure", nargs=2, metavar=("READER", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--generate", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        reader, path = args.measure
+        measure(readers[reader], path)
+        return
+    if args.generate:
+        generate(args.generate, args.rows, args.extra_columns)
+        return
+
+    width = max(len(reader) for reader in readers) + 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        subprocess.run(
+            [sys.executable, script, "--generate", path,
+             "--rows", str(args.rows), "--extra-columns", str(args.extra_columns)],
+            check=True,
+        )
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{label} : {args.rows} lignes, {size_mb:.0f} Mo")
+
+        for reader in readers:
+            out = subprocess.run(
+                [sys.executable, script, "--measure", reader, path],
+                check=True, capture_output=True, text=True,
+            )
+            result = json.loads(out.stdout)
+            print(f"{reader:>{width}} : {result['secondes']:7.2f} s  pic {result['pic_mo']:7.0f} Mo  "
+                  f"({result['lignes']} lignes x {result['colonnes']} colonnes)")
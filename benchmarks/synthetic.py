@@ -0,0 +1,189 @@
+# Générateur d'exports de mobilité synthétiques pour les benchmarks.
+#
+# Les distributions imitent les exports réels : quelques pays concentrent
+# l'essentiel des mobilités (loi de Zipf), les régions sont pondérées par leur
+# population, chaque établissement appartient à une région et garde le même
+# SIRET (quelques-uns avec une clé erronée), les dates mélangent plusieurs
+# formats avec quelques valeurs vides ou illisibles, et quelques pays et
+# régions sont saisis en majuscules ou avec des espaces superflus.
+#
+#   python benchmarks/synthetic.py --rows 10000 100000 1000000 --formats csv xlsx -o /tmp/exports
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pony_express.export import write_xlsx  # noqa: E402
+from pony_express.readers import BASE_COLUMNS, date_column  # noqa: E402
+
+PAYS = [
+    "Espagne", "Allemagne", "Italie", "Irlande", "Portugal", "Belgique", "Royaume-Uni", "Malte",
+    "Pays-Bas", "Finlande", "Suède", "Grèce", "Pologne", "Autriche", "Danemark", "Tchéquie",
+    "Norvège", "Roumanie", "Hongrie", "Croatie", "Slovénie", "Estonie", "Lituanie", "Chypre",
+    "Canada", "Japon", "Maroc", "Sénégal", "Tunisie", "Vietnam",
+]
+
+# Régions et poids approximatifs (population, en millions)
+REGIONS = {
+    "Auvergne-Rhône-Alpes": 8.1, "Bourgogne-Franche-Comté": 2.8, "Bretagne": 3.4,
+    "Centre-Val de Loire": 2.6, "Corse": 0.35, "Grand Est": 5.6, "Hauts-de-France": 6.0,
+    "Île-de-France": 12.3, "Normandie": 3.3, "Nouvelle-Aquitaine": 6.1, "Occitanie": 6.0,
+    "Pays de la Loire": 3.9, "Provence-Alpes-Côte d'Azur": 5.1, "Guadeloupe": 0.38,
+    "Martinique": 0.35, "Guyane": 0.29, "La Réunion": 0.87, "Mayotte": 0.3,
+}
+
+TYPES_ETABLISSEMENT = ["Lycée professionnel", "Lycée polyvalent", "Lycée agricole", "CFA", "Lycée des métiers"]
+PATRONYMES = ["Jean Moulin", "Marie Curie", "Jules Ferry", "Victor Hugo", "Louise Michel", "Paul Éluard",
+              "Simone Veil", "Jean Jaurès", "Condorcet", "Camille Claudel", "Gustave Eiffel", "Albert Camus"]
+
+# Formats de date et leur part dans les exports
+DATE_FORMATS = {
+    "%d/%m/%Y": 0.70,
+    "%Y-%m-%d": 0.15,
+    "%Y-%m-%d %H:%M:%S": 0.10,
+    "%d/%m/%Y %H:%M": 0.05,
+}
+
+# Parts des dates vides et illisibles
+BLANK_DATES = 0.01
+INVALID_DATES = 0.002
+
+# Part des lignes sans région
+MISSING_REGIONS = 0.005
+
+# Part des établissements dont le SIRET a une clé de Luhn erronée
+INVALID_SIRETS = 0.01
+
+# Part des lignes dont le pays ou la région est mal saisi
+LABEL_VARIANTS = 0.002
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+# Fonction pour calculer un SIRET valide (clé de Luhn) à partir de 13 chiffres
+def _luhn_complete(digits):
+    digits = np.asarray(digits, dtype=np.int64)
+    total = np.zeros(len(digits), dtype=np.int64)
+    for position in range(13):
+        digit = digits // 10 ** (12 - position) % 10
+        # En partant de la droite du SIRET complet, un chiffre sur deux est doublé
+        if position % 2 == 0:
+            digit = digit * 2
+            digit = digit - 9 * (digit > 9)
+        total += digit
+    return digits * 10 + (10 - total % 10) % 10
+
+
+def _establishments(rng, count):
+    regions = np.array(list(REGIONS))
+    weights = np.array(list(REGIONS.values()))
+    names = np.array([
+        f"{TYPES_ETABLISSEMENT[i % len(TYPES_ETABLISSEMENT)]} {PATRONYMES[i // len(TYPES_ETABLISSEMENT) % len(PATRONYMES)]} {i + 1}"
+        for i in range(count)
+    ])
+    sirets = _luhn_complete(rng.integers(10**12, 10**13, count))
+    invalid = rng.random(count) < INVALID_SIRETS
+    sirets[invalid] = sirets[invalid] // 10 * 10 + (sirets[invalid] + 1) % 10
+    return names, sirets.astype(str), rng.choice(regions, count, p=weights / weights.sum())
+
+
+def _dates(rng, rows):
+    days = rng.integers(0, 7 * 365, rows)
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(days, unit="D") + pd.to_timedelta(rng.integers(0, 86400, rows), unit="s")
+    formats = rng.choice(list(DATE_FORMATS), rows, p=list(DATE_FORMATS.values()))
+    values = np.empty(rows, dtype=object)
+    for fmt in DATE_FORMATS:
+        mask = formats == fmt
+        values[mask] = dates[mask].strftime(fmt)
+    noise = rng.random(rows)
+    values[noise < BLANK_DATES] = None
+    values[(noise >= BLANK_DATES) & (noise < BLANK_DATES + INVALID_DATES)] = "à préciser"
+    return values
+
+
+# Fonction pour altérer quelques libellés : majuscules, minuscules ou espaces superflus
+def _misspell(rng, values):
+    values = values.astype(object)
+    rows = np.flatnonzero((rng.random(len(values)) < LABEL_VARIANTS) & pd.notna(values))
+    for row, kind in zip(rows, rng.integers(0, 3, len(rows))):
+        values[row] = (values[row].upper(), values[row].lower(), f" {values[row]}  ")[kind]
+    return values
+
+
+# Fonction pour générer un export synthétique.
+# extra_columns ajoute des colonnes non utilisées par l'application
+# (montants, commentaires), présentes en nombre dans les exports réels.
+def generate_frame(rows, type_mobilite="sortante", extra_columns=20, seed=0):
+    rng = np.random.default_rng(seed)
+    etab_names, etab_sirets, etab_regions = _establishments(rng, min(5000, max(50, rows // 200)))
+    etab = rng.choice(len(etab_names), rows, p=_zipf_weights(len(etab_names), 0.8))
+
+    regions = etab_regions[etab].astype(object)
+    regions[rng.random(rows) < MISSING_REGIONS] = None
+
+    columns = {
+        "dossier_id": np.arange(1, rows + 1),
+        "pays": _misspell(rng, np.array(PAYS)[rng.choice(len(PAYS), rows, p=_zipf_weights(len(PAYS)))]),
+        "groupe_instructeur_label": _misspell(rng, regions),
+        "libelle_etablissement": etab_names[etab],
+        "demandeur_siret": etab_sirets[etab],
+        date_column(type_mobilite): _dates(rng, rows),
+    }
+    df = pd.DataFrame(columns)[["dossier_id"] + BASE_COLUMNS[:2] + [date_column(type_mobilite)] + BASE_COLUMNS[2:]]
+
+    for i in range(extra_columns):
+        if i % 3 == 0:
+            df[f"montant_{i}"] = np.round(rng.random(rows) * 1000, 2)
+        else:
+            df[f"champ_{i}"] = etab_names[rng.integers(0, len(etab_names), rows)]
+    return df
+
+
+# Fonction pour écrire un export au format des exports réels (CSV ';' avec
+# virgule décimale, ou classeur Excel)
+def write_export(df, path):
+    if path.endswith(".xlsx"):
+        write_xlsx(df, path)
+    else:
+        df.to_csv(path, sep=";", index=False, decimal=",")
+
+
+# Fonction pour générer un export CSV synthétique
+def generate_csv(path, rows, extra_columns=20, seed=0, type_mobilite="sortante"):
+    write_export(generate_frame(rows, type_mobilite, extra_columns, seed), path)
+
+
+# Nom de fichier d'un export généré
+def export_name(type_mobilite, rows, fmt):
+    return f"mobilite_{type_mobilite}_{rows}.{fmt}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère des exports de mobilité synthétiques.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--types", nargs="+", choices=["sortante", "entrante"], default=["sortante", "entrante"])
+    parser.add_argument("--extra-columns", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=".")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for type_mobilite in args.types:
+        for rows in args.rows:
+            df = generate_frame(rows, type_mobilite, args.extra_columns, args.seed)
+            for fmt in args.formats:
+                path = os.path.join(args.output, export_name(type_mobilite, rows, fmt))
+                write_export(df, path)
+                print(f"{path} : {os.path.getsize(path) / 1024 / 1024:.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
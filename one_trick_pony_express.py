@@ -1,8 +1,19 @@
 import streamlit as st
 import pandas as pd
-import io
+import os
+import uuid
 from datetime import datetime
-import base64
+from functools import partial
+
+from pony_express.cache import DataFrameCache, content_key
+from pony_express.cube import MEASURES, CountsCube
+from pony_express.export import DISPLAY_COLUMNS, EXPORT_FORMATS, GROUPED_FORMATS, display_frame, safe_name, to_grouped_bytes
+from pony_express.index import QueryIndex
+from pony_express.ingest import DEFAULT_CHUNKSIZE, DEFAULT_MIN_YEAR, MOBILITES, IngestError, ingest
+from pony_express.profiling import Profiler
+from pony_express.scheduler import IngestScheduler
+from pony_express.store import MobilityStore
+from pony_express.table import PAGE_SIZES, SEARCH_COLUMNS, matching_rows, page_bounds, sorted_rows
 
 # Configuration de la page
 st.set_page_config(
@@ -11,465 +22,542 @@ st.set_page_config(
     layout="wide",
 )
 
-# Fonction pour charger et nettoyer les données
-def load_data(file, type_mobilite="sortante"):
+# Année minimale des données chargées et affichées
+ANNEE_MIN = int(os.environ.get("PONY_ANNEE_MIN", DEFAULT_MIN_YEAR))
+
+# Nombre de lignes lues par bloc lors du chargement (0 : lecture d'un seul tenant)
+INGEST_CHUNKSIZE = int(os.environ.get("PONY_INGEST_CHUNKSIZE", DEFAULT_CHUNKSIZE)) or None
+
+# Dossier des fichiers persistants (cache des fichiers analysés, magasins incrémentaux)
+CACHE_DIR = os.environ.get("PONY_CACHE_DIR", os.path.expanduser("~/.cache/pony_express"))
+
+# Magasin partagé entre les sessions pour les fichiers déjà analysés (budgets
+# mémoire et disque et délai de libération configurables par variables
+# d'environnement)
+@st.cache_resource
+def get_data_cache():
+    max_bytes = int(os.environ.get("PONY_CACHE_MAX_MB", "512")) * 1024 * 1024
+    max_disk_bytes = int(os.environ.get("PONY_CACHE_DISK_MB", "2048")) * 1024 * 1024
+    idle_seconds = float(os.environ.get("PONY_CACHE_IDLE_S", "300"))
+    return DataFrameCache(max_bytes=max_bytes, cache_dir=CACHE_DIR,
+                          idle_seconds=idle_seconds, max_disk_bytes=max_disk_bytes)
+
+# Magasin incrémental d'un onglet, partagé entre les sessions : les
+# téléchargements successifs y sont fusionnés au lieu d'être relus en entier
+@st.cache_resource
+def get_mobility_store(tab_key):
+    return MobilityStore(os.path.join(CACHE_DIR, "magasins"), f"{tab_key}_{ANNEE_MIN}",
+                         type_mobilite=MOBILITES[tab_key], min_year=ANNEE_MIN)
+
+# Pool d'analyse des fichiers téléchargés, partagé entre les sessions
+@st.cache_resource
+def get_ingest_scheduler():
+    return IngestScheduler(max_workers=int(os.environ.get("PONY_INGEST_WORKERS", "4")))
+
+# Mesures des dernières exécutions, partagées entre les sessions ; chaque trace
+# est aussi ajoutée au journal JSONL PONY_PROFILE_LOG s'il est défini
+@st.cache_resource
+def get_profiler():
+    return Profiler(max_traces=int(os.environ.get("PONY_PROFILE_TRACES", "200")),
+                    log_path=os.environ.get("PONY_PROFILE_LOG") or None)
+
+# Panneau de diagnostic, réservé à l'exploitant (PONY_DEBUG_PANEL=1) : il
+# montre les noms de fichiers et les filtres de toutes les sessions
+def debug_panel_enabled():
+    return os.environ.get("PONY_DEBUG_PANEL") == "1"
+
+def _session_id():
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex[:8]
+    return st.session_state["session_id"]
+
+# Fonction pour charger et nettoyer les données.
+# Exécutée dans le pool d'analyse : aucune commande Streamlit ici (le
+# magasin est transmis par le script), les erreurs remontent à l'onglet qui
+# récupère le résultat.
+def load_data(file, type_mobilite="sortante", min_year=ANNEE_MIN, progress=None, cache=None, profiler=None):
+    # Réutiliser le résultat si le même fichier a déjà été analysé
+    if cache is None:
+        cache = get_data_cache()
+    cache_key = content_key(file.getvalue(), os.path.splitext(file.name)[1].lower(), type_mobilite, min_year)
+    dataset = cache.get(cache_key)
+    if dataset is None:
+        trace = profiler.trace("chargement", file.name) if profiler else None
+        df, report = ingest(file, file.name, type_mobilite=type_mobilite, min_year=min_year,
+                            chunksize=INGEST_CHUNKSIZE, progress=progress, trace=trace)
+        dataset = cache.put(cache_key, df, report)
+        if profiler:
+            profiler.finish(trace)
+    return dataset
+
+# Fonction pour fusionner un fichier dans le magasin incrémental d'un onglet.
+# Exécutée dans le pool d'analyse, comme load_data.
+def merge_upload(store, file, progress=None, profiler=None):
+    trace = profiler.trace("fusion", file.name) if profiler else None
+    report = store.merge(file, file.name, chunksize=INGEST_CHUNKSIZE, progress=progress, trace=trace)
+    if profiler:
+        profiler.finish(trace)
+    return report
+
+# Index des filtres, construit une fois par jeu de données chargé
+@st.cache_resource(max_entries=32)
+def get_query_index(dataset_key, _df):
+    return QueryIndex(_df)
+
+# Cube de comptages, calculé une fois par jeu de données chargé
+@st.cache_resource(max_entries=32)
+def get_counts_cube(dataset_key, _df):
+    return CountsCube(_df)
+
+# Fonction pour afficher la synthèse d'une année à partir du cube de comptages
+def render_summary(cube, year, countries, tab_key):
+    with st.expander(f"Synthèse {year}"):
+        totals = cube.year_totals(year)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Dossiers", totals["dossiers"])
+        col2.metric("Pays", totals["pays"])
+        col3.metric("Etablissements", totals["etablissements"])
+        col4.metric("SIRET", totals["sirets"])
+
+        # Tableau croisé pays x région, limité aux pays sélectionnés s'il y en a
+        measure = st.radio(
+            "Mesure",
+            options=list(MEASURES),
+            format_func=MEASURES.get,
+            horizontal=True,
+            key=f"{tab_key}_measure"
+        )
+        st.dataframe(cube.pivot(year, measure, countries))
+
+# Fonction pour afficher le rapport qualité du chargement : SIRET invalides
+# et variantes d'écriture des pays et régions regroupées
+def render_quality_report(quality):
+    if not quality:
+        return
+    normalized = sum(quality["libelles_normalises"].values())
+    if not quality["siret_invalides"] and not normalized:
+        return
+    with st.expander("Qualité des données"):
+        if quality["siret_invalides"]:
+            st.warning(f"{quality['siret_invalides']} ligne(s) avec un SIRET invalide "
+                       f"({quality['siret_invalides_distincts']} SIRET distinct(s)), par exemple : "
+                       f"{', '.join(quality['exemples_siret_invalides'])}.")
+        if normalized:
+            st.info(f"{normalized} libellé(s) de pays ou de région ramené(s) à une écriture unique.")
+            st.dataframe(pd.DataFrame([
+                {"Colonne": DISPLAY_COLUMNS.get(col, col), "Libellé retenu": label,
+                 "Variantes": ", ".join(repr(value) for value in values)}
+                for col, variants in quality["variantes"].items() for label, values in variants.items()
+            ]), hide_index=True)
+
+# Fonction pour produire un export, mesuré par le profileur s'il est actif
+def _profiled_export(profiler, fmt, filters, df, convert):
+    if profiler is None:
+        return convert(df)
+    trace = profiler.trace("export", f"{fmt} {filters}")
+    with trace.stage(f"export_{fmt}", len(df)) as record:
+        data = convert(df)
+        record["lignes_sortie"] = len(df)
+    profiler.finish(trace)
+    return data
+
+# Fonction pour sérialiser un résultat filtré, mémorisée par
+# (jeu de données, filtres, format) : un second téléchargement est immédiat
+@st.cache_data(max_entries=64, show_spinner=False)
+def export_bytes(dataset_key, filters, fmt, _df, _profiler=None):
+    return _profiled_export(_profiler, fmt, filters, _df, EXPORT_FORMATS[fmt][2])
+
+# Fonction pour afficher les boutons de téléchargement.
+# Le fichier n'est produit qu'au clic, sans relancer le script.
+def render_download_buttons(df, filename, dataset_key, filters):
+    col_csv, col_excel, _ = st.columns([1, 1, 4])
+    for col, fmt, label in ((col_csv, "csv", "Télécharger en CSV"), (col_excel, "xlsx", "Télécharger en Excel")):
+        extension, mime, _ = EXPORT_FORMATS[fmt]
+        with col:
+            st.download_button(
+                label,
+                data=partial(export_bytes, dataset_key, filters, fmt, df, get_profiler()),
+                file_name=f"{filename}.{extension}",
+                mime=mime,
+                on_click="ignore",
+                key=f"{filename}_{fmt}",
+            )
+
+# Fonction pour produire l'export de tous les pays d'une année (et d'une
+# région), un fichier ou une feuille par pays. La sélection n'est faite
+# qu'au clic, à partir de l'index.
+@st.cache_data(max_entries=8, show_spinner=False)
+def grouped_export_bytes(dataset_key, filters, fmt, basename, _df, _index, _profiler=None):
+    year, region = filters
+    selection = display_frame(_index.select(_df, year, _index.countries(year), region))
+    return _profiled_export(_profiler, fmt, filters, selection,
+                            partial(to_grouped_bytes, fmt=fmt, basename=basename))
+
+# Fonction pour afficher le téléchargement groupé de tous les pays de l'année
+# sélectionnée, pour la région sélectionnée ou la France entière
+def render_grouped_download(dataset, index, year, region, tab_key):
+    scope = region or "France entière"
+    with st.expander(f"Télécharger tous les pays - {year} - {scope}"):
+        fmt = st.radio(
+            "Format",
+            options=list(GROUPED_FORMATS),
+            format_func=lambda fmt: GROUPED_FORMATS[fmt][0],
+            horizontal=True,
+            key=f"{tab_key}_grouped_format"
+        )
+        _, extension, mime, _ = GROUPED_FORMATS[fmt]
+        basename = f"mobilite_{tab_key}_{year}" + (f"_{safe_name(region)}" if region else "")
+        # Seuls les pays ayant des lignes dans la région figurent dans l'export
+        countries = [pays for pays in index.countries(year) if region is None or region in index.regions(year, [pays])]
+        st.download_button(
+            f"Télécharger les {len(countries)} pays",
+            data=partial(grouped_export_bytes, dataset.key, (year, region), fmt, basename,
+                         dataset.df, index, get_profiler()),
+            file_name=f"{basename}.{extension}",
+            mime=mime,
+            on_click="ignore",
+            key=f"{tab_key}_grouped_{fmt}",
+        )
+
+# Fonction pour afficher un résultat page par page. La recherche et le tri
+# sont faits sur le serveur et seule la page affichée est envoyée au
+# navigateur ; les téléchargements portent toujours sur le résultat complet.
+def render_result_table(display_df, tab_key):
+    col_search, col_sort, col_order, col_size = st.columns([3, 2, 1, 1])
+    with col_search:
+        query = st.text_input(f"Rechercher ({' / '.join(SEARCH_COLUMNS)})", key=f"{tab_key}_search")
+    with col_sort:
+        sort_column = st.selectbox(
+            "Trier par",
+            options=[None] + list(display_df.columns),
+            format_func=lambda col: "Ordre du fichier" if col is None else col,
+            key=f"{tab_key}_sort"
+        )
+    with col_order:
+        descending = st.toggle("Décroissant", key=f"{tab_key}_descending")
+    with col_size:
+        page_size = st.selectbox("Lignes par page", options=PAGE_SIZES, key=f"{tab_key}_page_size")
+
+    positions = sorted_rows(display_df, matching_rows(display_df, query), sort_column, descending)
+    if not len(positions):
+        st.warning("Aucun enregistrement ne correspond à la recherche.")
+        return
+
+    # La page demandée est ramenée dans les bornes quand la recherche réduit le résultat
+    page_key = f"{tab_key}_page"
+    pages, _, _ = page_bounds(len(positions), 1, page_size)
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    _, start, stop = page_bounds(len(positions), page, page_size)
+
+    st.caption(f"Enregistrements {start + 1} à {stop} sur {len(positions)}")
+    st.dataframe(display_df.take(positions[start:stop]))
+
+def _upload_id(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+def _incremental(tab_key):
+    return st.session_state.get(f"{tab_key}_incremental", False)
+
+# Identifiant d'un chargement : le même fichier chargé en mode incrémental
+# ou non donne deux chargements distincts
+def _load_id(tab_key, uploaded_file):
+    return f"{_upload_id(uploaded_file)}:{'magasin' if _incremental(tab_key) else 'fichier'}"
+
+def _tab_dataset_loaded(tab_key, uploaded_file):
+    cached = st.session_state.get(f"{tab_key}_dataset")
+    return cached is not None and cached[0] == _load_id(tab_key, uploaded_file)
+
+# Fonction pour confier l'analyse d'un fichier au pool (sans doublon)
+def submit_upload(tab_key, uploaded_file):
+    job_id = f"{_load_id(tab_key, uploaded_file)}:{MOBILITES[tab_key]}:{ANNEE_MIN}"
+    label = f"{tab_key} ({uploaded_file.name})"
+    if _incremental(tab_key):
+        return get_ingest_scheduler().submit(
+            job_id, label,
+            merge_upload, get_mobility_store(tab_key), uploaded_file, profiler=get_profiler(),
+        )
+    return get_ingest_scheduler().submit(
+        job_id, label,
+        load_data, uploaded_file, type_mobilite=MOBILITES[tab_key], cache=get_data_cache(), profiler=get_profiler(),
+    )
+
+# Fonction pour lancer en parallèle l'analyse de tous les fichiers
+# téléchargés dans les onglets et pas encore chargés. Renvoie les analyses
+# encore en cours.
+def schedule_uploads():
+    jobs = []
+    for tab_key, _, _ in ONGLETS:
+        uploaded_file = st.session_state.get(f"{tab_key}_file")
+        if uploaded_file is not None and not _tab_dataset_loaded(tab_key, uploaded_file):
+            jobs.append(submit_upload(tab_key, uploaded_file))
+    return [job for job in jobs if not job.done()]
+
+# Le fichier ou le mode d'un onglet a changé : un onglet est un fragment, la
+# page entière est relancée pour que l'analyse parte avec celles des autres
+# onglets et que sa progression soit suivie
+def _on_upload_change():
+    st.session_state["_relancer_page"] = True
+
+# Fonction pour afficher la progression des analyses en cours, relue à
+# intervalle régulier sans bloquer le script ; la page est relancée quand
+# toutes sont terminées
+@st.fragment(run_every=0.5)
+def render_upload_progress():
+    jobs = schedule_uploads()
+    if not jobs:
+        st.rerun(scope="app")
+    for job in jobs:
+        st.progress(job.progress, text=f"Chargement {job.label} : {job.progress:.0%}")
+
+# Fonction pour obtenir le jeu de données d'un onglet. Tant que le même
+# fichier reste chargé, sa poignée est conservée dans l'état de session de
+# l'onglet : une interaction ne relit ni ne hache à nouveau le fichier. La
+# poignée remplacée ou abandonnée libère sa référence sur le magasin partagé.
+# En mode incrémental, l'onglet affiche l'état courant du magasin de l'onglet.
+def get_tab_dataset(tab_key, uploaded_file):
+    state_key = f"{tab_key}_dataset"
+    if _tab_dataset_loaded(tab_key, uploaded_file):
+        if _incremental(tab_key):
+            return get_mobility_store(tab_key).snapshot()
+        return st.session_state[state_key][1]
+
+    # Le fichier est en général déjà en cours d'analyse (schedule_uploads) ;
+    # sa progression est affichée en haut de la page
+    job = submit_upload(tab_key, uploaded_file)
+    if not job.done():
+        st.info("Analyse du fichier en cours...")
+        return None
+    get_ingest_scheduler().discard(job.job_id)
+
     try:
-        # Déterminer le type de fichier
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file, sep=None, engine='python')
-        elif file.name.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file)
-        else:
-            st.error("Format de fichier non supporté. Veuillez charger un fichier CSV ou Excel.")
-            return None
-        
-        # Vérifier les colonnes nécessaires en fonction du type de mobilité
-        if type_mobilite == "entrante":
-            required_cols = ['pays', 'groupe_instructeur_label', 'date_debut_mobilite_entrante']
-        else:
-            required_cols = ['pays', 'groupe_instructeur_label', 'date_depart']
-            
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        
-        if missing_cols:
-            st.error(f"Les colonnes suivantes sont manquantes dans le fichier : {', '.join(missing_cols)}")
-            return None
-        
-        # Nettoyer les données
-        if type_mobilite == "entrante":
-            df['date_debut_mobilite_entrante'] = pd.to_datetime(df['date_debut_mobilite_entrante'], errors='coerce')
-            df['annee'] = df['date_debut_mobilite_entrante'].dt.year
-        else:
-            df['date_depart'] = pd.to_datetime(df['date_depart'], errors='coerce')
-            df['annee'] = df['date_depart'].dt.year
-        
-        # Vérifier si la colonne libelle_etablissement existe
-        if 'libelle_etablissement' not in df.columns:
-            df['libelle_etablissement'] = "Non disponible"
-            
-        # Vérifier si la colonne demandeur_siret existe
-        if 'demandeur_siret' not in df.columns:
-            df['demandeur_siret'] = "Non disponible"
-            
-        return df
-    
+        dataset = job.result()
+    except IngestError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Erreur lors du chargement du fichier: {str(e)}")
         return None
 
-# Fonction pour générer un lien de téléchargement
-def get_download_link(df, filename):
-    csv_buffer = io.BytesIO()
-    excel_buffer = io.BytesIO()
-    
-    df.to_csv(csv_buffer, index=False)
-    df.to_excel(excel_buffer, index=False)
-    
-    csv_b64 = base64.b64encode(csv_buffer.getvalue()).decode()
-    excel_b64 = base64.b64encode(excel_buffer.getvalue()).decode()
-    
-    csv_href = f'<a href="data:file/csv;base64,{csv_b64}" download="{filename}.csv">Télécharger en CSV</a>'
-    excel_href = f'<a href="data:file/excel;base64,{excel_b64}" download="{filename}.xlsx">Télécharger en Excel</a>'
-    
-    return csv_href, excel_href
+    if _incremental(tab_key):
+        st.session_state[state_key] = (_load_id(tab_key, uploaded_file), None)
+        return get_mobility_store(tab_key).snapshot()
 
-# Titre principal
-st.title("One Trick Pony express")
+    handle = get_data_cache().acquire(dataset)
+    st.session_state[state_key] = (_load_id(tab_key, uploaded_file), handle)
+    return handle
 
-# Création des onglets
-tabs = st.tabs(["Mobilité Apprenants", "Mobilité Personnel", "Mobilité Collective", "Mobilité Entrante"])
+# Fonction pour afficher un onglet : chargement du fichier, filtres et résultats.
+# Chaque onglet est un fragment : une interaction dans un onglet ne relance
+# que cet onglet, pas les trois autres. Chaque exécution est mesurée étape
+# par étape (panneau de diagnostic et journal).
+@st.fragment
+def render_mobility_tab(tab_key, header, subheader):
+    trace = get_profiler().trace("onglet", tab_key, session=_session_id())
+    try:
+        _render_mobility_tab(tab_key, header, subheader, trace)
+    finally:
+        # Les onglets sans fichier chargé ne sont pas enregistrés
+        if trace.stages:
+            get_profiler().finish(trace)
 
-# Dictionnaire pour stocker les dataframes
-data = {"apprenants": None, "personnel": None, "collective": None, "entrante": None}
+def _render_mobility_tab(tab_key, header, subheader, trace):
+    if st.session_state.pop("_relancer_page", False):
+        st.rerun(scope="app")
 
-# Onglet 1: Mobilité Apprenants
-with tabs[0]:
     # Titre de l'onglet
-    st.header("Mobilité des Apprenants")
-    
-    # Zone de téléchargement de fichier (dans la page principale)
-    col1, col2 = st.columns([1, 3])
-    with col1:
-        uploaded_file = st.file_uploader("Télécharger le fichier de mobilité apprenants", type=["csv", "xlsx", "xls"], key="apprenants_file")
-    
-    if uploaded_file is not None:
-        data["apprenants"] = load_data(uploaded_file, type_mobilite="sortante")
-        
-        if data["apprenants"] is not None:
-            st.write(f"Total des enregistrements: {len(data['apprenants'])}")
-            
-            # Filtres dans la page principale
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                # Filtre pour l'année d'abord
-                all_years = sorted(data["apprenants"]["annee"].dropna().unique().astype(int))
-                # Filtrer pour commencer à 2023
-                available_years = [year for year in all_years if year >= 2023]
-                if available_years:
-                    selected_year = st.selectbox(
-                        "Sélectionner l'année",
-                        options=available_years,
-                        index=0
-                    )
-                    
-                    # Filtrer les données par année
-                    year_data = data["apprenants"][data["apprenants"]["annee"] == selected_year]
-                    
-            with col2:
-                if available_years:
-                    # Filtrer les pays disponibles pour l'année sélectionnée
-                    available_countries = sorted([str(pays) for pays in year_data["pays"].unique()])
-                    selected_countries = st.multiselect(
-                        "Sélectionner les pays",
-                        options=available_countries,
-                        default=[]
-                    )
-            
-            with col3:
-                # Seulement afficher le filtre de région si des pays sont sélectionnés
-                selected_region = None
-                if 'selected_countries' in locals() and selected_countries:
-                    country_year_data = year_data[year_data["pays"].isin(selected_countries)]
-                    available_regions = ["France entière"] + sorted(country_year_data["groupe_instructeur_label"].unique())
-                    selected_region = st.selectbox(
-                        "Sélectionner la région",
-                        options=available_regions,
-                        index=0
-                    )
-            
-            # Filtrer les données si tous les filtres nécessaires sont sélectionnés
-            if 'selected_countries' in locals() and 'selected_region' in locals() and selected_countries and selected_region is not None:
-                filtered_df = data["apprenants"][data["apprenants"]["annee"] == selected_year]
-                filtered_df = filtered_df[filtered_df["pays"].isin(selected_countries)]
-                
-                if selected_region != "France entière":
-                    filtered_df = filtered_df[filtered_df["groupe_instructeur_label"] == selected_region]
-                
-                # Afficher le résultat
-                if not filtered_df.empty:
-                    st.subheader(f"Mobilité des apprenants - {', '.join(selected_countries)} - {selected_year}")
-                    
-                    # Sélectionner uniquement les colonnes requises
-                    display_columns = ["groupe_instructeur_label", "pays", "libelle_etablissement", "demandeur_siret"]
-                    display_df = filtered_df[display_columns].copy()
-                    display_df.columns = ["Region", "Pays", "Etablissement", "SIRET"]
-                    
-                    # Afficher le nombre total de lignes
-                    st.info(f"Nombre total d'enregistrements : {len(display_df)}")
-                    
-                    # Afficher le tableau
-                    st.dataframe(display_df)
-                    
-                    # Générer le lien de téléchargement
-                    filename = f"mobilite_apprenants_{'-'.join(selected_countries)}_{selected_year}"
-                    csv_link, excel_link = get_download_link(display_df, filename)
-                    st.markdown(f"{csv_link} | {excel_link}", unsafe_allow_html=True)
-                else:
-                    st.warning("Aucune donnée ne correspond aux filtres sélectionnés.")
-            elif 'selected_countries' in locals() and selected_countries:
-                st.info("Veuillez sélectionner une région pour afficher les résultats.")
-            else:
-                st.info("Veuillez sélectionner au moins un pays pour continuer.")
-            
-            if available_years is not None and len(available_years) == 0:
-                st.warning("Aucune donnée disponible pour les années à partir de 2023.")
-    else:
-        st.info("Veuillez télécharger un fichier de données pour commencer l'analyse.")
+    st.header(header)
 
-# Onglet 2: Mobilité Personnel
-with tabs[1]:
-    # Titre de l'onglet
-    st.header("Mobilité du Personnel")
-    
     # Zone de téléchargement de fichier (dans la page principale)
     col1, col2 = st.columns([1, 3])
     with col1:
-        uploaded_file = st.file_uploader("Télécharger le fichier de mobilité personnel", type=["csv", "xlsx", "xls"], key="personnel_file")
-    
-    if uploaded_file is not None:
-        data["personnel"] = load_data(uploaded_file, type_mobilite="sortante")
-        
-        if data["personnel"] is not None:
-            st.write(f"Total des enregistrements: {len(data['personnel'])}")
-            
-            # Filtres dans la page principale
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                # Filtre pour l'année d'abord
-                all_years = sorted(data["personnel"]["annee"].dropna().unique().astype(int))
-                # Filtrer pour commencer à 2023
-                available_years = [year for year in all_years if year >= 2023]
-                if available_years:
-                    selected_year = st.selectbox(
-                        "Sélectionner l'année",
-                        options=available_years,
-                        index=0,
-                        key="personnel_year"
-                    )
-                    
-                    # Filtrer les données par année
-                    year_data = data["personnel"][data["personnel"]["annee"] == selected_year]
-            
-            with col2:
-                if available_years:
-                    # Filtrer les pays disponibles pour l'année sélectionnée
-                    available_countries = sorted([str(pays) for pays in year_data["pays"].unique()])
-                    selected_countries = st.multiselect(
-                        "Sélectionner les pays",
-                        options=available_countries,
-                        default=[],
-                        key="personnel_countries"
-                    )
-            
-            with col3:
-                # Seulement afficher le filtre de région si des pays sont sélectionnés
-                selected_region = None
-                if 'selected_countries' in locals() and selected_countries:
-                    country_year_data = year_data[year_data["pays"].isin(selected_countries)]
-                    available_regions = ["France entière"] + sorted(country_year_data["groupe_instructeur_label"].unique())
-                    selected_region = st.selectbox(
-                        "Sélectionner la région",
-                        options=available_regions,
-                        index=0,
-                        key="personnel_region"
-                    )
-            
-            # Filtrer les données si tous les filtres nécessaires sont sélectionnés
-            if 'selected_countries' in locals() and 'selected_region' in locals() and selected_countries and selected_region is not None:
-                filtered_df = data["personnel"][data["personnel"]["annee"] == selected_year]
-                filtered_df = filtered_df[filtered_df["pays"].isin(selected_countries)]
-                
-                if selected_region != "France entière":
-                    filtered_df = filtered_df[filtered_df["groupe_instructeur_label"] == selected_region]
-                
-                # Afficher le résultat
-                if not filtered_df.empty:
-                    st.subheader(f"Mobilité du personnel - {', '.join(selected_countries)} - {selected_year}")
-                    
-                    # Sélectionner uniquement les colonnes requises
-                    display_columns = ["groupe_instructeur_label", "pays", "libelle_etablissement", "demandeur_siret"]
-                    display_df = filtered_df[display_columns].copy()
-                    display_df.columns = ["Region", "Pays", "Etablissement", "SIRET"]
-                    
-                    # Afficher le nombre total de lignes
-                    st.info(f"Nombre total d'enregistrements : {len(display_df)}")
-                    
-                    # Afficher le tableau
-                    st.dataframe(display_df)
-                    
-                    # Générer le lien de téléchargement
-                    filename = f"mobilite_personnel_{'-'.join(selected_countries)}_{selected_year}"
-                    csv_link, excel_link = get_download_link(display_df, filename)
-                    st.markdown(f"{csv_link} | {excel_link}", unsafe_allow_html=True)
-                else:
-                    st.warning("Aucune donnée ne correspond aux filtres sélectionnés.")
-            elif 'selected_countries' in locals() and selected_countries:
-                st.info("Veuillez sélectionner une région pour afficher les résultats.")
-            else:
-                st.info("Veuillez sélectionner au moins un pays pour continuer.")
-            
-            if available_years is not None and len(available_years) == 0:
-                st.warning("Aucune donnée disponible pour les années à partir de 2023.")
-    else:
+        uploaded_file = st.file_uploader(f"Télécharger le fichier de mobilité {tab_key}", type=["csv", "xlsx", "xls"], key=f"{tab_key}_file",
+                                         on_change=_on_upload_change)
+        incremental = st.toggle(
+            "Chargement incrémental",
+            key=f"{tab_key}_incremental",
+            on_change=_on_upload_change,
+            help="Fusionne le fichier avec les chargements précédents : seules les lignes nouvelles ou modifiées sont analysées."
+        )
+
+    if uploaded_file is None:
+        st.session_state.pop(f"{tab_key}_dataset", None)
         st.info("Veuillez télécharger un fichier de données pour commencer l'analyse.")
+        return
 
-# Onglet 3: Mobilité Collective
-with tabs[2]:
-    # Titre de l'onglet
-    st.header("Mobilité Collective")
-    
-    # Zone de téléchargement de fichier (dans la page principale)
-    col1, col2 = st.columns([1, 3])
-    with col1:
-        uploaded_file = st.file_uploader("Télécharger le fichier de mobilité collective", type=["csv", "xlsx", "xls"], key="collective_file")
-    
-    if uploaded_file is not None:
-        data["collective"] = load_data(uploaded_file, type_mobilite="sortante")
-        
-        if data["collective"] is not None:
-            st.write(f"Total des enregistrements: {len(data['collective'])}")
-            
-            # Filtres dans la page principale
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                # Filtre pour l'année d'abord
-                all_years = sorted(data["collective"]["annee"].dropna().unique().astype(int))
-                # Filtrer pour commencer à 2023
-                available_years = [year for year in all_years if year >= 2023]
-                if available_years:
-                    selected_year = st.selectbox(
-                        "Sélectionner l'année",
-                        options=available_years,
-                        index=0,
-                        key="collective_year"
-                    )
-                    
-                    # Filtrer les données par année
-                    year_data = data["collective"][data["collective"]["annee"] == selected_year]
-            
-            with col2:
-                if available_years:
-                    # Filtrer les pays disponibles pour l'année sélectionnée
-                    available_countries = sorted([str(pays) for pays in year_data["pays"].unique()])
-                    selected_countries = st.multiselect(
-                        "Sélectionner les pays",
-                        options=available_countries,
-                        default=[],
-                        key="collective_countries"
-                    )
-            
-            with col3:
-                # Seulement afficher le filtre de région si des pays sont sélectionnés
-                selected_region = None
-                if 'selected_countries' in locals() and selected_countries:
-                    country_year_data = year_data[year_data["pays"].isin(selected_countries)]
-                    available_regions = ["France entière"] + sorted(country_year_data["groupe_instructeur_label"].unique())
-                    selected_region = st.selectbox(
-                        "Sélectionner la région",
-                        options=available_regions,
-                        index=0,
-                        key="collective_region"
-                    )
-            
-            # Filtrer les données si tous les filtres nécessaires sont sélectionnés
-            if 'selected_countries' in locals() and 'selected_region' in locals() and selected_countries and selected_region is not None:
-                filtered_df = data["collective"][data["collective"]["annee"] == selected_year]
-                filtered_df = filtered_df[filtered_df["pays"].isin(selected_countries)]
-                
-                if selected_region != "France entière":
-                    filtered_df = filtered_df[filtered_df["groupe_instructeur_label"] == selected_region]
-                
-                # Afficher le résultat
-                if not filtered_df.empty:
-                    st.subheader(f"Mobilité collective - {', '.join(selected_countries)} - {selected_year}")
-                    
-                    # Sélectionner uniquement les colonnes requises
-                    display_columns = ["groupe_instructeur_label", "pays", "libelle_etablissement", "demandeur_siret"]
-                    display_df = filtered_df[display_columns].copy()
-                    display_df.columns = ["Region", "Pays", "Etablissement", "SIRET"]
-                    
-                    # Afficher le nombre total de lignes
-                    st.info(f"Nombre total d'enregistrements : {len(display_df)}")
-                    
-                    # Afficher le tableau
-                    st.dataframe(display_df)
-                    
-                    # Générer le lien de téléchargement
-                    filename = f"mobilite_collective_{'-'.join(selected_countries)}_{selected_year}"
-                    csv_link, excel_link = get_download_link(display_df, filename)
-                    st.markdown(f"{csv_link} | {excel_link}", unsafe_allow_html=True)
-                else:
-                    st.warning("Aucune donnée ne correspond aux filtres sélectionnés.")
-            elif 'selected_countries' in locals() and selected_countries:
-                st.info("Veuillez sélectionner une région pour afficher les résultats.")
-            else:
-                st.info("Veuillez sélectionner au moins un pays pour continuer.")
-            
-            if available_years is not None and len(available_years) == 0:
-                st.warning("Aucune donnée disponible pour les années à partir de 2023.")
+    with trace.stage("chargement") as record:
+        dataset = get_tab_dataset(tab_key, uploaded_file)
+        record["lignes_sortie"] = 0 if dataset is None else len(dataset.df)
+    if dataset is None:
+        return
+
+    # Signaler les dates illisibles plutôt que de les ignorer silencieusement
+    if dataset.report.get("dates_invalides"):
+        st.warning(f"{dataset.report['dates_invalides']} date(s) n'ont pas pu être interprétées et ont été ignorées.")
+    render_quality_report(dataset.report.get("qualite"))
+
+    # Le magasin incrémental tient lui-même son index et son cube à jour
+    if incremental:
+        report = dataset.report
+        st.caption(f"Dernière fusion : {report.get('lignes_nouvelles', 0)} ligne(s) nouvelle(s), "
+                   f"{report.get('lignes_modifiees', 0)} modifiée(s), {report.get('lignes_inchangees', 0)} inchangée(s).")
+        index, cube = dataset.index, dataset.cube
     else:
-        st.info("Veuillez télécharger un fichier de données pour commencer l'analyse.")
+        with trace.stage("index", len(dataset.df)):
+            index = get_query_index(dataset.key, dataset.df)
+            cube = get_counts_cube(dataset.key, dataset.df)
+    st.write(f"Total des enregistrements à partir de {ANNEE_MIN}: {len(dataset.df)}")
+
+    # Filtres dans la page principale
+    col1, col2, col3 = st.columns(3)
+    selected_countries = []
+    selected_region = None
+
+    # Filtrer pour commencer à l'année minimale. Les options des menus sont
+    # mesurées ensemble (étape « options »)
+    with trace.stage("options"):
+        available_years = [year for year in index.years if year >= ANNEE_MIN]
 
-# Onglet 4: Mobilité Entrante
-with tabs[3]:
-    # Titre de l'onglet
-    st.header("Mobilité Entrante")
-    
-    # Zone de téléchargement de fichier (dans la page principale)
-    col1, col2 = st.columns([1, 3])
     with col1:
-        uploaded_file = st.file_uploader("Télécharger le fichier de mobilité entrante", type=["csv", "xlsx", "xls"], key="entrante_file")
-    
-    if uploaded_file is not None:
-        data["entrante"] = load_data(uploaded_file, type_mobilite="entrante")
-        
-        if data["entrante"] is not None:
-            st.write(f"Total des enregistrements: {len(data['entrante'])}")
-            
-            # Filtres dans la page principale
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                # Filtre pour l'année d'abord
-                all_years = sorted(data["entrante"]["annee"].dropna().unique().astype(int))
-                # Filtrer pour commencer à 2023
-                available_years = [year for year in all_years if year >= 2023]
-                if available_years:
-                    selected_year = st.selectbox(
-                        "Sélectionner l'année",
-                        options=available_years,
-                        index=0,
-                        key="entrante_year"
-                    )
-                    
-                    # Filtrer les données par année
-                    year_data = data["entrante"][data["entrante"]["annee"] == selected_year]
-            
-            with col2:
-                if available_years:
-                    # Filtrer les pays disponibles pour l'année sélectionnée
-                    available_countries = sorted([str(pays) for pays in year_data["pays"].unique()])
-                    selected_countries = st.multiselect(
-                        "Sélectionner les pays",
-                        options=available_countries,
-                        default=[],
-                        key="entrante_countries"
-                    )
-            
-            with col3:
-                # Seulement afficher le filtre de région si des pays sont sélectionnés
-                selected_region = None
-                if 'selected_countries' in locals() and selected_countries:
-                    country_year_data = year_data[year_data["pays"].isin(selected_countries)]
-                    available_regions = ["France entière"] + sorted(country_year_data["groupe_instructeur_label"].unique())
-                    selected_region = st.selectbox(
-                        "Sélectionner la région",
-                        options=available_regions,
-                        index=0,
-                        key="entrante_region"
-                    )
-            
-            # Filtrer les données si tous les filtres nécessaires sont sélectionnés
-            if 'selected_countries' in locals() and 'selected_region' in locals() and selected_countries and selected_region is not None:
-                filtered_df = data["entrante"][data["entrante"]["annee"] == selected_year]
-                filtered_df = filtered_df[filtered_df["pays"].isin(selected_countries)]
-                
-                if selected_region != "France entière":
-                    filtered_df = filtered_df[filtered_df["groupe_instructeur_label"] == selected_region]
-                
-                # Afficher le résultat
-                if not filtered_df.empty:
-                    st.subheader(f"Mobilité entrante - {', '.join(selected_countries)} - {selected_year}")
-                    
-                    # Sélectionner uniquement les colonnes requises
-                    display_columns = ["groupe_instructeur_label", "pays", "libelle_etablissement", "demandeur_siret"]
-                    display_df = filtered_df[display_columns].copy()
-                    display_df.columns = ["Region", "Pays", "Etablissement", "SIRET"]
-                    
-                    # Afficher le nombre total de lignes
-                    st.info(f"Nombre total d'enregistrements : {len(display_df)}")
-                    
-                    # Afficher le tableau
-                    st.dataframe(display_df)
-                    
-                    # Générer le lien de téléchargement
-                    filename = f"mobilite_entrante_{'-'.join(selected_countries)}_{selected_year}"
-                    csv_link, excel_link = get_download_link(display_df, filename)
-                    st.markdown(f"{csv_link} | {excel_link}", unsafe_allow_html=True)
-                else:
-                    st.warning("Aucune donnée ne correspond aux filtres sélectionnés.")
-            elif 'selected_countries' in locals() and selected_countries:
-                st.info("Veuillez sélectionner une région pour afficher les résultats.")
-            else:
-                st.info("Veuillez sélectionner au moins un pays pour continuer.")
-            
-            if available_years is not None and len(available_years) == 0:
-                st.warning("Aucune donnée disponible pour les années à partir de 2023.")
+        # Filtre pour l'année d'abord
+        if available_years:
+            selected_year = st.selectbox(
+                "Sélectionner l'année",
+                options=available_years,
+                index=0,
+                key=f"{tab_key}_year"
+            )
+
+    with col2:
+        if available_years:
+            # Pays disponibles pour l'année sélectionnée
+            with trace.stage("options"):
+                available_countries = index.countries(selected_year)
+            selected_countries = st.multiselect(
+                "Sélectionner les pays",
+                options=available_countries,
+                default=[],
+                key=f"{tab_key}_countries"
+            )
+
+    with col3:
+        # Seulement afficher le filtre de région si des pays sont sélectionnés
+        if selected_countries:
+            with trace.stage("options"):
+                available_regions = ["France entière"] + index.regions(selected_year, selected_countries)
+            selected_region = st.selectbox(
+                "Sélectionner la région",
+                options=available_regions,
+                index=0,
+                key=f"{tab_key}_region"
+            )
+
+    # Synthèse de l'année sélectionnée
+    if available_years:
+        with trace.stage("synthese"):
+            render_summary(cube, selected_year, selected_countries, tab_key)
+
+    # Filtrer les données si tous les filtres nécessaires sont sélectionnés
+    if selected_countries and selected_region is not None:
+        region = None if selected_region == "France entière" else selected_region
+        with trace.stage("filtrage", len(dataset.df)) as record:
+            filtered_df = index.select(dataset.df, selected_year, selected_countries, region)
+            # Sélectionner uniquement les colonnes requises
+            display_df = display_frame(filtered_df)
+            record["lignes_sortie"] = len(display_df)
+
+        # Afficher le résultat
+        if not filtered_df.empty:
+            st.subheader(f"{subheader} - {', '.join(selected_countries)} - {selected_year}")
+
+            # Afficher le nombre total de lignes
+            st.info(f"Nombre total d'enregistrements : {len(display_df)}")
+
+            # Afficher le tableau, page par page
+            with trace.stage("rendu", len(display_df)):
+                render_result_table(display_df, tab_key)
+
+            # Boutons de téléchargement
+            filename = f"mobilite_{tab_key}_{'-'.join(selected_countries)}_{selected_year}"
+            filters = (selected_year, tuple(selected_countries), selected_region)
+            render_download_buttons(display_df, filename, dataset.key, filters)
+        else:
+            st.warning("Aucune donnée ne correspond aux filtres sélectionnés.")
+    elif selected_countries:
+        st.info("Veuillez sélectionner une région pour afficher les résultats.")
     else:
-        st.info("Veuillez télécharger un fichier de données pour commencer l'analyse.")
+        st.info("Veuillez sélectionner au moins un pays pour continuer.")
+
+    # Téléchargement groupé, un fichier par pays
+    if available_years:
+        region = None if selected_region in (None, "France entière") else selected_region
+        render_grouped_download(dataset, index, selected_year, region, tab_key)
+
+    if len(available_years) == 0:
+        st.warning(f"Aucune donnée disponible pour les années à partir de {ANNEE_MIN}.")
+
+# Panneau de diagnostic : durée de chaque étape des dernières exécutions
+# (toutes sessions confondues) et état du cache des fichiers
+@st.fragment
+def render_debug_panel():
+    with st.expander("Diagnostic des performances"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            count = st.slider("Dernières exécutions", min_value=5, max_value=200, value=20, step=5, key="debug_count")
+        with col2:
+            st.button("Actualiser", key="debug_refresh")
+        traces = get_profiler().recent(count)
+        if not traces:
+            st.info("Aucune exécution mesurée pour l'instant.")
+        else:
+            # Une ligne par exécution, une colonne par étape (secondes)
+            summary = pd.DataFrame([
+                {"Horodatage": trace["horodatage"], "Type": trace["type"], "Libellé": trace["libelle"],
+                 "Session": trace["session"], "Total (s)": trace["secondes"],
+                 **{name: stage["secondes"] for name, stage in trace["etapes"].items()}}
+                for trace in traces
+            ])
+            st.dataframe(summary, hide_index=True)
+
+            # Détail des étapes : lignes en entrée et en sortie, mémoire
+            details = pd.DataFrame([
+                {"Horodatage": trace["horodatage"], "Libellé": trace["libelle"], "Etape": name,
+                 "Secondes": stage["secondes"], "Appels": stage["appels"],
+                 "Lignes en entrée": stage["lignes_entree"], "Lignes en sortie": stage["lignes_sortie"],
+                 "Mémoire (Mo)": None if stage["memoire_octets"] is None else stage["memoire_octets"] / 1024 / 1024}
+                for trace in traces for name, stage in trace["etapes"].items()
+            ])
+            st.dataframe(details, hide_index=True)
+
+        st.caption("Cache des fichiers analysés")
+        st.json(get_data_cache().stats(), expanded=False)
+
+# Titre principal
+st.title("One Trick Pony express")
+
+# Onglets : clé, titre et sous-titre des résultats
+ONGLETS = [
+    ("apprenants", "Mobilité des Apprenants", "Mobilité des apprenants"),
+    ("personnel", "Mobilité du Personnel", "Mobilité du personnel"),
+    ("collective", "Mobilité Collective", "Mobilité collective"),
+    ("entrante", "Mobilité Entrante", "Mobilité entrante"),
+]
+
+# Analyse en parallèle des fichiers en attente : le premier affichage ne
+# dépend que du plus gros fichier, pas de la somme des quatre
+if schedule_uploads():
+    render_upload_progress()
+
+# Création des onglets
+tabs = st.tabs(["Mobilité Apprenants", "Mobilité Personnel", "Mobilité Collective", "Mobilité Entrante"])
+
+for tab, (tab_key, header, subheader) in zip(tabs, ONGLETS):
+    with tab:
+        render_mobility_tab(tab_key, header, subheader)
+
+if debug_panel_enabled():
+    render_debug_panel()
 
 # Ajouter un pied de page
 st.markdown("---")
@@ -0,0 +1,2 @@
+# Logique de chargement et de traitement des fichiers de mobilité,
+# indépendante de l'interface Streamlit.
@@ -0,0 +1,134 @@
+# Génération en ligne de commande de tous les extraits (année x pays x région),
+# sans passer par l'interface Streamlit.
+#
+#   python -m pony_express.batch --apprenants apprenants.csv --entrante entrante.xlsx \
+#       --output extraits/ --formats csv xlsx --workers 8
+#
+# Chaque fichier source est analysé une seule fois ; le résultat est déposé
+# dans un dossier temporaire et chaque processus du pool le relit au plus une
+# fois pour produire les extraits des couples (année, pays) qui lui sont confiés.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from pony_express.export import display_frame, safe_name, write_xlsx
+from pony_express.index import QueryIndex
+from pony_express.ingest import DEFAULT_MIN_YEAR, MOBILITES, IngestError, ingest
+
+# Jeux de données déjà relus par le processus courant : tab_key -> (df, index)
+_loaded = {}
+
+
+def _parse_file(tab_key, path, min_year, workdir):
+    with open(path, "rb") as f:
+        df, report = ingest(f, os.path.basename(path), type_mobilite=MOBILITES[tab_key], min_year=min_year)
+    parsed_path = os.path.join(workdir, f"{tab_key}.pkl")
+    df.to_pickle(parsed_path)
+
+    index = QueryIndex(df)
+    tasks = [(year, pays) for year in index.years for pays in index.countries(year)]
+    return tab_key, parsed_path, tasks, report
+
+
+def _get_dataset(tab_key, parsed_path):
+    if tab_key not in _loaded:
+        df = pd.read_pickle(parsed_path)
+        _loaded[tab_key] = (df, QueryIndex(df))
+    return _loaded[tab_key]
+
+
+def _write(df, path, formats):
+    written = []
+    for fmt in formats:
+        target = f"{path}.{fmt}"
+        if fmt == "csv":
+            df.to_csv(target, index=False)
+        else:
+            write_xlsx(df, target)
+        written.append(target)
+    return written
+
+
+# Extraits d'un couple (année, pays) : « France entière » puis chaque région
+def _write_extracts(tab_key, parsed_path, year, pays, output, formats):
+    df, index = _get_dataset(tab_key, parsed_path)
+    directory = os.path.join(output, tab_key, str(year), safe_name(pays))
+    os.makedirs(directory, exist_ok=True)
+    basename = f"mobilite_{tab_key}_{safe_name(pays)}_{year}"
+
+    written = _write(display_frame(index.select(df, year, [pays])), os.path.join(directory, basename), formats)
+    for region in index.regions(year, [pays]):
+        extract = display_frame(index.select(df, year, [pays], region))
+        written += _write(extract, os.path.join(directory, f"{basename}_{safe_name(region)}"), formats)
+    return written
+
+
+def run(inputs, output, formats=("csv", "xlsx"), workers=None, min_year=DEFAULT_MIN_YEAR, log=print):
+    start = time.perf_counter()
+    failures = 0
+    written = 0
+
+    with tempfile.TemporaryDirectory() as workdir, ProcessPoolExecutor(max_workers=workers) as pool:
+        # 1. Analyse des fichiers sources, en parallèle
+        parsing = {
+            pool.submit(_parse_file, tab_key, path, min_year, workdir): tab_key
+            for tab_key, path in inputs.items()
+        }
+        extracts = []
+        for future in as_completed(parsing):
+            tab_key = parsing[future]
+            try:
+                tab_key, parsed_path, tasks, report = future.result()
+            except IngestError as e:
+                log(f"[{tab_key}] {e}")
+                failures += 1
+                continue
+            except Exception as e:
+                # Fichier absent ou illisible : les autres fichiers sont traités
+                log(f"[{tab_key}] Erreur lors du chargement du fichier : {e}")
+                failures += 1
+                continue
+            log(f"[{tab_key}] {report['lignes_conservees']} lignes conservées sur {report['lignes_lues']}, "
+                f"{len(tasks)} couples année x pays, {report['qualite']['siret_invalides']} SIRET invalide(s)")
+
+            # 2. Extraits de chaque couple (année, pays), répartis sur le pool
+            extracts += [
+                pool.submit(_write_extracts, tab_key, parsed_path, year, pays, output, formats)
+                for year, pays in tasks
+            ]
+
+        for future in as_completed(extracts):
+            written += len(future.result())
+
+    log(f"{written} fichiers écrits dans {output} en {time.perf_counter() - start:.1f} s")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pony_express.batch",
+        description="Génère tous les extraits (année x pays x région) des fichiers de mobilité.",
+    )
+    for tab_key in MOBILITES:
+        parser.add_argument(f"--{tab_key}", metavar="FICHIER", help=f"fichier de mobilité {tab_key} (CSV ou Excel)")
+    parser.add_argument("--output", "-o", required=True, help="dossier de destination des extraits")
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus (par défaut : nombre de cœurs)")
+    parser.add_argument("--annee-min", type=int, default=DEFAULT_MIN_YEAR, help="année minimale des extraits")
+    args = parser.parse_args(argv)
+
+    inputs = {tab_key: getattr(args, tab_key) for tab_key in MOBILITES if getattr(args, tab_key)}
+    if not inputs:
+        parser.error("au moins un fichier de mobilité est nécessaire")
+
+    failures = run(inputs, args.output, args.formats, args.workers, args.annee_min)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# Magasin des fichiers de mobilité déjà analysés, partagé par toutes les
+# sessions du processus.
+#
+# Les DataFrames sont indexés par un hash du contenu du fichier téléchargé :
+# toutes les sessions qui chargent le même export partagent une seule copie
+# en mémoire. Les sessions n'en détiennent que des poignées (DatasetHandle) ;
+# une entrée qui n'est plus référencée par aucune session est libérée après
+# un délai d'inactivité, ou plus tôt si le budget mémoire est dépassé
+# (éviction LRU). Les entrées référencées ne sont jamais évincées.
+#
+# Chaque entrée est aussi écrite sur disque (Parquet si pyarrow est
+# disponible, pickle sinon) pour survivre aux évictions et aux redémarrages
+# du serveur. Elle peut porter des métadonnées sérialisables en JSON
+# (rapport de chargement), stockées à côté. La place occupée sur disque est
+# bornée (max_disk_bytes) : après chaque écriture, les entrées les plus
+# anciennement écrites ou relues sont supprimées.
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+# A incrémenter dès que le résultat de load_data change de forme,
+# pour ne pas relire des entrées disque obsolètes
+CACHE_VERSION = 6
+
+try:
+    import pyarrow  # noqa: F401
+    DISK_FORMAT = "parquet"
+except ImportError:
+    DISK_FORMAT = "pickle"
+
+
+# Jeu de données chargé : clé de cache, DataFrame et rapport de chargement
+Dataset = namedtuple("Dataset", ["key", "df", "report"])
+
+
+# Fonction pour calculer la clé de cache d'un fichier
+def content_key(content, *parts):
+    h = hashlib.blake2b(content, digest_size=20)
+    for part in (CACHE_VERSION,) + parts:
+        h.update(b"\x00")
+        h.update(str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+# Fonction pour estimer l'empreinte mémoire d'un DataFrame
+def frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class _Entry:
+    __slots__ = ("df", "meta", "size", "refs", "released_at")
+
+    def __init__(self, df, meta, size):
+        self.df = df
+        self.meta = meta
+        self.size = size
+        self.refs = 0
+        self.released_at = time.monotonic()
+
+
+# Poignée détenue par une session sur un jeu de données du magasin.
+# La référence est rendue par release() ou, à défaut, quand la poignée est
+# détruite (session fermée, fichier remplacé dans l'onglet).
+class DatasetHandle:
+    def __init__(self, cache, dataset):
+        self.dataset = dataset
+        self._finalizer = weakref.finalize(self, cache._release, dataset.key)
+
+    @property
+    def key(self):
+        return self.dataset.key
+
+    @property
+    def df(self):
+        return self.dataset.df
+
+    @property
+    def report(self):
+        return self.dataset.report
+
+    def release(self):
+        self._finalizer()
+
+
+class DataFrameCache:
+    def __init__(self, max_bytes, cache_dir=None, idle_seconds=300, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return Dataset(key, entry.df, entry.meta)
+
+        # Absent de la mémoire : on tente le disque
+        found = self._disk_read(key)
+        with self._lock:
+            if found is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            return self._insert(key, *found)
+
+    def put(self, key, df, meta=None):
+        meta = meta or {}
+        self._disk_write(key, df, meta)
+        with self._lock:
+            return self._insert(key, df, meta)
+
+    # Fonction pour obtenir une poignée sur un jeu de données : tant qu'elle
+    # existe, l'entrée reste en mémoire et partagée entre les sessions
+    def acquire(self, dataset):
+        with self._lock:
+            entry = self._entries.get(dataset.key)
+            if entry is None:
+                # Évincée entre-temps : on la réinsère avec le DataFrame détenu
+                self._insert(dataset.key, dataset.df, dataset.report)
+                entry = self._entries[dataset.key]
+            entry.refs += 1
+            self._entries.move_to_end(dataset.key)
+            return DatasetHandle(self, Dataset(dataset.key, entry.df, entry.meta))
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                if entry.refs == 0:
+                    entry.released_at = time.monotonic()
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entrees": len(self._entries),
+                "entrees_referencees": sum(1 for entry in self._entries.values() if entry.refs),
+                "references": sum(entry.refs for entry in self._entries.values()),
+                "octets_residents": self._nbytes,
+                "octets_max": self.max_bytes,
+                "succes_memoire": self._hits,
+                "succes_disque": self._disk_hits,
+                "echecs": self._misses,
+                "taux_succes": (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _insert(self, key, df, meta):
+        # Une entrée déjà présente est conservée : les sessions partagent la même copie
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(df, meta, frame_nbytes(df))
+            self._entries[key] = entry
+            self._nbytes += entry.size
+        self._entries.move_to_end(key)
+        dataset = Dataset(key, entry.df, entry.meta)
+        self._evict(keep=key)
+        return dataset
+
+    # Éviction des entrées non référencées : inactives depuis trop longtemps,
+    # puis les moins récemment utilisées tant que le budget est dépassé
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.refs or key == keep:
+                continue
+            if self._nbytes > self.max_bytes or now - entry.released_at >= self.idle_seconds:
+                del self._entries[key]
+                self._nbytes -= entry.size
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.{DISK_FORMAT}")
+
+    def _disk_exists(self, key):
+        return bool(self.cache_dir) and os.path.exists(self._disk_path(key))
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _disk_read(self, key):
+        if not self._disk_exists(key):
+            return None
+        path = self._disk_path(key)
+        try:
+            if DISK_FORMAT == "parquet":
+                df = pd.read_parquet(path)
+            else:
+                df = pd.read_pickle(path)
+            with open(self._meta_path(key), encoding="utf-8") as f:
+                meta = json.load(f)
+            # Entrée relue : elle passe en tête pour le nettoyage du disque
+            os.utime(path)
+            return df, meta
+        except Exception:
+            # Fichier corrompu ou illisible : on le supprime et on relit la source
+            for stale in (path, self._meta_path(key)):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            return None
+
+    def _disk_write(self, key, df, meta):
+        if not self.cache_dir or self._disk_exists(key):
+            return
+        path = self._disk_path(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Les métadonnées sont écrites d'abord : une entrée n'est visible
+            # qu'une fois le fichier de données renommé
+            with open(self._meta_path(key) + suffix, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(self._meta_path(key) + suffix, self._meta_path(key))
+            if DISK_FORMAT == "parquet":
+                df.to_parquet(path + suffix, index=False)
+            else:
+                df.to_pickle(path + suffix)
+            os.replace(path + suffix, path)
+            self._prune_disk(keep=key)
+        except Exception:
+            # Le cache disque est une optimisation : une erreur d'écriture
+            # ne doit pas empêcher l'affichage des données
+            for tmp_path in (path + suffix, self._meta_path(key) + suffix):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    # Fonction pour ramener le cache disque sous son budget, en supprimant
+    # d'abord les entrées les plus anciennement écrites ou relues
+    def _prune_disk(self, keep=None):
+        if not self.max_disk_bytes:
+            return
+        entries = []
+        with os.scandir(self.cache_dir) as items:
+            for item in items:
+                key, extension = os.path.splitext(item.name)
+                if extension != f".{DISK_FORMAT}" or not item.is_file():
+                    continue
+                try:
+                    stat = item.stat()
+                    size = stat.st_size + os.path.getsize(self._meta_path(key))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, key, size))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if key == keep:
+                continue
+            for path in (self._disk_path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
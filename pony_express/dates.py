@@ -0,0 +1,113 @@
+# Conversion des colonnes de date des exports.
+#
+# pd.to_datetime sans format retombe sur une analyse élément par élément
+# (dateutil) dès que l'export mélange plusieurs formats. Ici, le format
+# dominant est détecté sur un échantillon et appliqué de façon vectorisée ;
+# les valeurs restantes sont analysées une seule fois par valeur distincte
+# (les dates de départ se répètent beaucoup), et les valeurs illisibles sont
+# comptées au lieu d'être silencieusement remplacées par NaT.
+import numpy as np
+import pandas as pd
+
+# Formats rencontrés dans les exports, du plus courant au plus rare
+CANDIDATE_FORMATS = [
+    "%d/%m/%Y",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+]
+
+SAMPLE_SIZE = 1000
+
+
+# Fonction pour détecter le format le plus fréquent sur un échantillon
+def detect_format(values, sample_size=SAMPLE_SIZE):
+    sample = pd.Series(values.dropna().head(sample_size * 5).unique()[:sample_size], dtype=object)
+    if sample.empty:
+        return None
+
+    best_format, best_count = None, 0
+    for fmt in CANDIDATE_FORMATS:
+        count = pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        if count > best_count:
+            best_format, best_count = fmt, count
+    return best_format
+
+
+def _parse_one(value):
+    if not isinstance(value, str):
+        return pd.to_datetime(value, errors="coerce")
+    value = value.strip()
+    try:
+        # Jour en premier pour les dates françaises, sauf pour les dates ISO
+        ts = pd.to_datetime(value, dayfirst=not value[:4].isdigit())
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+    if ts is pd.NaT:
+        return ts
+    # Les horodatages ISO avec fuseau sont ramenés à l'heure locale naïve
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts
+
+
+# Fonction pour analyser des valeurs distinctes : d'abord chaque format
+# candidat de façon vectorisée, puis valeur par valeur pour le reste
+def _parse_uniques(values):
+    values = pd.Series(values, dtype=object)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in CANDIDATE_FORMATS:
+        todo = parsed.isna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(values[todo], format=fmt, errors="coerce").astype("datetime64[ns]")
+    todo = parsed.isna()
+    parsed[todo] = [_parse_one(value) for value in values[todo]]
+    return dict(zip(values, parsed))
+
+
+class DateParser:
+    # Le format détecté et les valeurs déjà analysées sont conservés d'un
+    # bloc à l'autre lors d'une lecture par blocs
+    def __init__(self, fmt=None):
+        self.fmt = fmt
+        self.invalid = 0
+        self._memo = {}
+
+    def parse(self, values):
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+
+        # Les dates se répètent beaucoup : on n'analyse que les valeurs distinctes
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype=object)
+
+        if self.fmt is None:
+            self.fmt = detect_format(uniques) or ""
+
+        if self.fmt:
+            parsed = pd.to_datetime(uniques, format=self.fmt, errors="coerce").astype("datetime64[ns]")
+        else:
+            parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+        remaining = parsed.isna()
+        if remaining.any():
+            new_values = [value for value in uniques[remaining] if value not in self._memo]
+            if new_values:
+                self._memo.update(_parse_uniques(new_values))
+            parsed[remaining] = [self._memo[value] for value in uniques[remaining]]
+
+            # Les cellules vides ne sont pas comptées comme des erreurs
+            invalid = parsed.isna() & (uniques.astype(str).str.strip() != "")
+            if invalid.any():
+                counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+                self.invalid += int(counts[invalid.to_numpy()].sum())
+
+        # Le code -1 (valeur manquante) pointe sur le NaT ajouté en fin de tableau
+        result = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))[codes]
+        return pd.Series(result, index=values.index, name=values.name)
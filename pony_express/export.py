@@ -0,0 +1,143 @@
+# Sérialisation des résultats filtrés pour le téléchargement.
+#
+# Le classeur Excel est produit par openpyxl en mode write_only : les lignes
+# sont écrites au fil de l'eau sans construire le modèle objet complet de la
+# feuille, ce qui garde une mémoire constante quel que soit le nombre de lignes.
+#
+# Les exports groupés (un fichier ou une feuille par pays) parcourent un seul
+# groupby du résultat et écrivent chaque groupe directement dans l'archive :
+# un seul fichier sérialisé est en cours d'écriture à la fois, et l'archive
+# est construite dans un fichier temporaire plutôt qu'en mémoire.
+import io
+import re
+import tempfile
+import zipfile
+
+from openpyxl import Workbook
+
+# Colonnes affichées et exportées, avec leur libellé
+DISPLAY_COLUMNS = {
+    "groupe_instructeur_label": "Region",
+    "pays": "Pays",
+    "libelle_etablissement": "Etablissement",
+    "demandeur_siret": "SIRET",
+}
+
+CSV_MIME = "text/csv"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIME = "application/zip"
+
+# Au-delà, le fichier temporaire d'un export groupé passe de la mémoire au disque
+SPOOL_BYTES = 32 * 1024 * 1024
+
+
+# Fonction pour obtenir un nom de fichier sans caractères interdits
+def safe_name(value):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", str(value)).strip("_")
+
+
+# Fonction pour ne garder que les colonnes affichées, renommées
+def display_frame(df):
+    return df[list(DISPLAY_COLUMNS)].rename(columns=DISPLAY_COLUMNS)
+
+
+# Fonction pour convertir un DataFrame en CSV
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def _rows(df):
+    # Les valeurs manquantes deviennent des cellules vides
+    values = df.astype(object).where(df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+# Fonction pour écrire un DataFrame dans une feuille Excel en streaming
+def write_xlsx_sheet(workbook, df, title="Sheet1"):
+    sheet = workbook.create_sheet(title=title)
+    sheet.append([str(col) for col in df.columns])
+    for row in _rows(df):
+        sheet.append(row)
+    return sheet
+
+
+# Fonction pour écrire un DataFrame dans un classeur Excel (chemin ou fichier)
+def write_xlsx(df, target, title="Sheet1"):
+    workbook = Workbook(write_only=True)
+    write_xlsx_sheet(workbook, df, title)
+    workbook.save(target)
+
+
+# Fonction pour convertir un DataFrame en classeur Excel
+def to_xlsx_bytes(df):
+    buffer = io.BytesIO()
+    write_xlsx(df, buffer)
+    return buffer.getvalue()
+
+
+# Formats proposés au téléchargement : extension, type MIME et fonction de conversion
+EXPORT_FORMATS = {
+    "csv": ("csv", CSV_MIME, to_csv_bytes),
+    "xlsx": ("xlsx", XLSX_MIME, to_xlsx_bytes),
+}
+
+
+# Groupes d'un résultat selon une colonne (un seul groupby), par ordre alphabétique
+def _groups(df, column):
+    for value, group in df.groupby(column, observed=True, sort=True):
+        yield value, group
+
+
+# Nom de feuille Excel valide (31 caractères au plus, sans []:*?/\) et unique
+def _sheet_title(value, used):
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(value)).strip("'")[:31] or "Feuille"
+    title, n = base, 1
+    while title.lower() in used:
+        n += 1
+        title = f"{base[:31 - len(str(n)) - 1]}_{n}"
+    used.add(title.lower())
+    return title
+
+
+# Fonction pour écrire une archive ZIP d'un fichier (CSV ou Excel) par
+# valeur de column, dans un chemin ou un fichier ouvert
+def write_zip(df, target, fmt="csv", column="Pays", basename="extrait"):
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for value, group in _groups(df, column):
+            with archive.open(f"{basename}_{safe_name(value)}.{fmt}", "w") as member:
+                if fmt == "csv":
+                    with io.TextIOWrapper(member, encoding="utf-8", newline="") as text:
+                        group.to_csv(text, index=False)
+                else:
+                    write_xlsx(group, member, title=_sheet_title(value, set()))
+
+
+# Fonction pour écrire un classeur Excel d'une feuille par valeur de column
+def write_xlsx_sheets(df, target, column="Pays"):
+    workbook = Workbook(write_only=True)
+    used = set()
+    for value, group in _groups(df, column):
+        write_xlsx_sheet(workbook, group, _sheet_title(value, used))
+    if not used:
+        write_xlsx_sheet(workbook, df)
+    workbook.save(target)
+
+
+# Fonction pour produire un export groupé : l'archive est écrite dans un
+# fichier temporaire, relu une seule fois à la fin
+def to_grouped_bytes(df, fmt, column="Pays", basename="extrait"):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as f:
+        if fmt == "xlsx_feuilles":
+            write_xlsx_sheets(df, f, column)
+        else:
+            write_zip(df, f, GROUPED_FORMATS[fmt][3], column, basename)
+        f.seek(0)
+        return f.read()
+
+
+# Exports groupés par pays : libellé, extension, type MIME et format des fichiers de l'archive
+GROUPED_FORMATS = {
+    "zip_csv": ("Archive ZIP (un CSV par pays)", "zip", ZIP_MIME, "csv"),
+    "zip_xlsx": ("Archive ZIP (un Excel par pays)", "zip", ZIP_MIME, "xlsx"),
+    "xlsx_feuilles": ("Excel (une feuille par pays)", "xlsx", XLSX_MIME, None),
+}
@@ -0,0 +1,137 @@
+# Index des lignes par (annee, pays, groupe_instructeur_label).
+#
+# Construit une seule fois par jeu de données chargé, il fournit directement
+# les listes triées des menus déroulants et les positions des lignes
+# correspondant à une sélection, sans reparcourir tout le DataFrame à chaque
+# interaction. Le magasin incrémental le tient à jour en ajoutant ou retirant
+# des positions, sans le reconstruire : il met à jour une copie puis la
+# publie, l'index déjà remis aux sessions n'est jamais modifié.
+import copy
+
+import numpy as np
+
+INDEX_COLUMNS = ['annee', 'pays', 'groupe_instructeur_label']
+
+
+def _is_missing(value):
+    return value is None or value != value
+
+
+# Groupes (annee, pays, région) d'un DataFrame et positions de leurs lignes.
+# Les valeurs manquantes restent dans les groupes (dropna=False) pour que les
+# lignes sans région figurent dans « France entière ».
+def _groups(df):
+    groups = df.groupby(INDEX_COLUMNS, observed=True, sort=False, dropna=False).indices
+    for (year, pays, region), positions in groups.items():
+        if _is_missing(year) or _is_missing(pays):
+            continue
+        yield int(year), str(pays), None if _is_missing(region) else region, positions
+
+
+class QueryIndex:
+    def __init__(self, df):
+        self.nrows = len(df)
+        self._dtype = np.int32 if len(df) < 2**31 else np.int64
+        # annee -> pays -> région (None si manquante) -> positions des lignes
+        self._rows = {}
+        for year, pays, region, positions in _groups(df):
+            by_country = self._rows.setdefault(year, {})
+            by_region = by_country.setdefault(pays, {})
+            by_region[region] = positions.astype(self._dtype)
+
+        # Options des menus, triées une fois pour toutes
+        self.years = sorted(self._rows)
+        self._countries = {}
+        self._regions = {}
+        self._refresh_options(self.years)
+
+    def _refresh_options(self, years):
+        for year in years:
+            for key in [key for key in self._regions if key[0] == year]:
+                del self._regions[key]
+            by_country = self._rows.get(year)
+            if not by_country:
+                self._rows.pop(year, None)
+                self._countries.pop(year, None)
+                continue
+            self._countries[year] = sorted(by_country)
+            for pays, by_region in by_country.items():
+                self._regions[(year, pays)] = sorted(region for region in by_region if region is not None)
+        self.years = sorted(self._rows)
+
+    # Copie indépendante des dictionnaires (les tableaux de positions sont
+    # remplacés, jamais modifiés, et peuvent être partagés)
+    def copy(self):
+        other = copy.copy(self)
+        other._rows = {
+            year: {pays: dict(by_region) for pays, by_region in by_country.items()}
+            for year, by_country in self._rows.items()
+        }
+        other._countries = dict(self._countries)
+        other._regions = dict(self._regions)
+        other.years = list(self.years)
+        return other
+
+    # Fonction pour indexer des lignes ajoutées ou modifiées du DataFrame
+    # (positions dans df). Renvoie les années touchées.
+    def add(self, df, positions):
+        positions = np.asarray(positions, dtype=self._dtype)
+        self.nrows = len(df)
+        years = set()
+        for year, pays, region, local in _groups(df.iloc[positions][INDEX_COLUMNS]):
+            by_region = self._rows.setdefault(year, {}).setdefault(pays, {})
+            existing = by_region.get(region)
+            added = positions[local]
+            by_region[region] = added if existing is None else np.union1d(existing, added).astype(self._dtype)
+            years.add(year)
+        self._refresh_options(years)
+        return years
+
+    # Fonction pour retirer des lignes de l'index. groups contient les
+    # anciennes valeurs (annee, pays, région) de ces lignes.
+    def remove(self, groups, positions):
+        positions = np.asarray(positions, dtype=self._dtype)
+        years = set()
+        for year, pays, region, local in _groups(groups):
+            by_country = self._rows.get(year, {})
+            by_region = by_country.get(pays, {})
+            existing = by_region.get(region)
+            if existing is None:
+                continue
+            remaining = np.setdiff1d(existing, positions[local], assume_unique=True).astype(self._dtype)
+            if len(remaining):
+                by_region[region] = remaining
+            else:
+                del by_region[region]
+                if not by_region:
+                    del by_country[pays]
+            years.add(year)
+        self._refresh_options(years)
+        return years
+
+    def countries(self, year):
+        return self._countries.get(year, [])
+
+    def regions(self, year, countries):
+        regions = set()
+        for pays in countries:
+            regions.update(self._regions.get((year, pays), []))
+        return sorted(regions)
+
+    # Positions des lignes sélectionnées, dans l'ordre du fichier.
+    # region=None correspond à « France entière ».
+    def rows(self, year, countries, region=None):
+        by_country = self._rows.get(year, {})
+        parts = []
+        for pays in countries:
+            for key, positions in by_country.get(pays, {}).items():
+                if region is None or key == region:
+                    parts.append(positions)
+        if not parts:
+            return np.empty(0, dtype=self._dtype)
+        rows = np.concatenate(parts)
+        rows.sort()
+        return rows
+
+    def select(self, df, year, countries, region=None):
+        return df.take(self.rows(year, countries, region))
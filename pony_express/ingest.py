@@ -0,0 +1,188 @@
+# Chargement d'un fichier de mobilité : lecture, contrôle des colonnes,
+# conversion des dates et filtrage des années.
+#
+# En mode streaming (chunksize), le fichier est lu par blocs et les lignes
+# antérieures à l'année minimale sont écartées avant la concaténation, si bien
+# que la mémoire dépend des données conservées et non de l'historique complet.
+# Les colonnes de libellés, qui ne comptent que peu de valeurs distinctes,
+# sont contrôlées (SIRET, variantes d'écriture des pays et régions) et
+# converties en catégories dès la lecture de chaque bloc.
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from pony_express.dates import DateParser
+from pony_express.profiling import stage
+from pony_express.quality import QualityCheck
+from pony_express.readers import date_column, read_csv_chunks, read_csv_fast, read_excel_chunks, used_columns
+
+# Année minimale affichée par défaut dans les onglets
+DEFAULT_MIN_YEAR = 2023
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Type de mobilité (schéma du fichier) de chaque onglet
+MOBILITES = {
+    "apprenants": "sortante",
+    "personnel": "sortante",
+    "collective": "sortante",
+    "entrante": "entrante",
+}
+
+# Colonnes stockées sous forme de catégories (codes entiers + dictionnaire)
+CATEGORY_COLUMNS = ['pays', 'groupe_instructeur_label', 'libelle_etablissement', 'demandeur_siret']
+
+
+class IngestError(ValueError):
+    pass
+
+
+# Fonction pour lire un fichier (CSV ou Excel) par blocs : renvoie les noms
+# des colonnes et un itérateur de DataFrames
+def read_chunks(source, name, columns, chunksize):
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".csv":
+        if chunksize:
+            return read_csv_chunks(source, columns, chunksize)
+        df = read_csv_fast(source, columns)
+        return list(df.columns), iter([df])
+    if extension in (".xls", ".xlsx"):
+        return read_excel_chunks(source, name, columns, chunksize)
+    raise IngestError("Format de fichier non supporté. Veuillez charger un fichier CSV ou Excel.")
+
+
+# Taille de la source en octets (chemin ou fichier ouvert)
+def source_size(source):
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+# Fraction du fichier déjà lue, quand la source est un fichier ouvert
+def read_fraction(source, size):
+    if not size or not hasattr(source, "tell"):
+        return None
+    return source.tell() / size
+
+
+# Fonction pour préparer un bloc : dates, filtre des années, contrôle qualité
+# et catégories
+def prepare_chunk(chunk, date_col, min_year, date_parser, trace=None, quality=None):
+    with stage(trace, "dates", len(chunk)) as record:
+        chunk[date_col] = date_parser.parse(chunk[date_col])
+        chunk['annee'] = chunk[date_col].dt.year
+        record["lignes_sortie"] = len(chunk)
+    with stage(trace, "filtre_annee", len(chunk)) as record:
+        if min_year is not None:
+            chunk = chunk[chunk['annee'] >= min_year]
+        record["lignes_sortie"] = len(chunk)
+    if quality is not None:
+        with stage(trace, "qualite", len(chunk)) as record:
+            chunk = quality.apply(chunk)
+            record["lignes_sortie"] = len(chunk)
+    with stage(trace, "categories", len(chunk)) as record:
+        chunk = chunk.assign(**{
+            col: chunk[col].astype("category") for col in CATEGORY_COLUMNS if col in chunk.columns
+        })
+        record["lignes_sortie"] = len(chunk)
+    return chunk
+
+
+# Fonction pour concaténer des blocs en fusionnant les dictionnaires des catégories
+def concat_chunks(chunks):
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+
+    columns = list(chunks[0].columns)
+    category_cols = [col for col in CATEGORY_COLUMNS if col in columns]
+    df = pd.concat([chunk.drop(columns=category_cols) for chunk in chunks], ignore_index=True)
+    for col in category_cols:
+        try:
+            values = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True)
+        except TypeError:
+            # Catégories de types différents d'un bloc à l'autre (cellules Excel mixtes)
+            values = pd.concat([chunk[col].astype(object) for chunk in chunks], ignore_index=True).astype("category")
+        df[col] = pd.Series(values, index=df.index)
+    return df[columns]
+
+
+# Fonction pour vérifier les colonnes nécessaires en fonction du type de mobilité
+def require_columns(columns, type_mobilite):
+    required_cols = ['pays', 'groupe_instructeur_label', date_column(type_mobilite)]
+    missing_cols = [col for col in required_cols if col not in columns]
+    if missing_cols:
+        raise IngestError(f"Les colonnes suivantes sont manquantes dans le fichier : {', '.join(missing_cols)}")
+
+
+# Fonction pour compléter un DataFrame préparé : colonnes optionnelles
+# absentes de certains exports et année sur 16 bits
+def finish_frame(df):
+    if 'libelle_etablissement' not in df.columns:
+        df['libelle_etablissement'] = pd.Categorical(["Non disponible"] * len(df))
+    if 'demandeur_siret' not in df.columns:
+        df['demandeur_siret'] = pd.Categorical(["Non disponible"] * len(df))
+
+    # Entier nullable si des dates manquent encore
+    df['annee'] = df['annee'].astype("Int16" if df['annee'].isna().any() else "int16")
+    return df
+
+
+# Fonction pour charger et nettoyer un fichier de mobilité.
+# Renvoie le DataFrame et un rapport de chargement (dictionnaire sérialisable).
+# progress, s'il est fourni, est appelé avec la fraction du fichier déjà lue ;
+# trace (pony_express.profiling), si elle est fournie, reçoit la durée de
+# chaque étape (lecture, dates, filtre des années, contrôle qualité,
+# catégories, concaténation).
+def ingest(source, name, type_mobilite="sortante", min_year=DEFAULT_MIN_YEAR, chunksize=DEFAULT_CHUNKSIZE,
+           progress=None, trace=None):
+    date_col = date_column(type_mobilite)
+    size = source_size(source) if progress else None
+    with stage(trace, "lecture"):
+        columns, chunks = read_chunks(source, name, used_columns(type_mobilite), chunksize)
+
+    require_columns(columns, type_mobilite)
+
+    date_parser = DateParser()
+    quality = QualityCheck()
+    rows_read = 0
+    kept = []
+    chunks = iter(chunks)
+    while True:
+        # La lecture effective a lieu à chaque bloc demandé à l'itérateur
+        with stage(trace, "lecture") as record:
+            chunk = next(chunks, None)
+            record["lignes_sortie"] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        rows_read += len(chunk)
+        chunk = prepare_chunk(chunk, date_col, min_year, date_parser, trace, quality)
+        # Les blocs entièrement filtrés ne sont pas conservés
+        if len(chunk):
+            kept.append(chunk)
+        if progress:
+            fraction = read_fraction(source, size)
+            if fraction is not None:
+                progress(fraction)
+    with stage(trace, "concatenation", sum(len(chunk) for chunk in kept)):
+        if kept:
+            df = concat_chunks(kept)
+        else:
+            df = prepare_chunk(pd.DataFrame(columns=columns), date_col, min_year, date_parser)
+
+    df = finish_frame(df)
+
+    if progress:
+        progress(1.0)
+
+    report = {
+        "lignes_lues": rows_read,
+        "lignes_conservees": len(df),
+        "format_date": date_parser.fmt or None,
+        "dates_invalides": date_parser.invalid,
+        "qualite": quality.report(),
+    }
+    return df, report
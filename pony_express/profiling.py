@@ -0,0 +1,124 @@
+# Mesure légère des étapes du parcours d'un onglet.
+#
+# Chaque exécution (rendu d'un onglet, analyse d'un fichier, export) produit
+# une trace : pour chaque étape, la durée, le nombre de lignes en entrée et en
+# sortie et la variation de la mémoire résidente. Une étape exécutée plusieurs
+# fois dans la même trace (par exemple par bloc de lignes) est cumulée. Les
+# dernières traces sont gardées en mémoire pour le panneau de diagnostic et
+# peuvent être ajoutées à un fichier JSONL pour agréger les latences en
+# production.
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+# Mémoire résidente actuelle du processus (Linux), None si indisponible
+def rss_bytes():
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Trace:
+    def __init__(self, kind, label, session=None):
+        self.kind = kind
+        self.label = label
+        self.session = session
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.seconds = None
+
+    def add(self, name, seconds, rows_in=None, rows_out=None, memory=None):
+        stage = self.stages.setdefault(name, {
+            "secondes": 0.0, "lignes_entree": None, "lignes_sortie": None, "memoire_octets": None, "appels": 0,
+        })
+        stage["secondes"] += seconds
+        stage["appels"] += 1
+        for key, value in (("lignes_entree", rows_in), ("lignes_sortie", rows_out), ("memoire_octets", memory)):
+            if value is not None:
+                stage[key] = (stage[key] or 0) + value
+
+    # Contexte mesurant une étape. Le dictionnaire renvoyé permet de
+    # renseigner les lignes en sortie une fois l'étape exécutée.
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = {"lignes_entree": rows_in, "lignes_sortie": None}
+        rss = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            after = rss_bytes()
+            memory = after - rss if rss is not None and after is not None else None
+            self.add(name, elapsed, record["lignes_entree"], record["lignes_sortie"], memory)
+
+    def close(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "horodatage": datetime.fromtimestamp(self.started).isoformat(timespec="milliseconds"),
+            "type": self.kind,
+            "libelle": self.label,
+            "session": self.session,
+            "secondes": self.seconds,
+            "etapes": self.stages,
+        }
+
+
+# Fonction pour mesurer une étape si une trace est fournie (sans coût sinon)
+def stage(trace, name, rows_in=None):
+    if trace is None:
+        return nullcontext({"lignes_entree": rows_in, "lignes_sortie": None})
+    return trace.stage(name, rows_in)
+
+
+class Profiler:
+    def __init__(self, max_traces=50, log_path=None):
+        self.log_path = log_path
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    def trace(self, kind, label, session=None):
+        return Trace(kind, label, session)
+
+    # Fonction pour enregistrer une trace terminée
+    def finish(self, trace):
+        trace.close()
+        record = trace.to_dict()
+        with self._lock:
+            self._traces.append(record)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError:
+                    # Le journal est un outil de diagnostic : il ne doit pas
+                    # interrompre l'affichage
+                    pass
+        return record
+
+    # Dernières traces, de la plus récente à la plus ancienne
+    def recent(self, count=None):
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        return traces[:count] if count else traces
@@ -0,0 +1,180 @@
+# Contrôle qualité des colonnes de libellés au chargement.
+#
+# Les SIRET sont vérifiés par la clé de Luhn (avec l'exception de La Poste,
+# dont les établissements partagent le SIREN 356000000 et sont validés par la
+# somme de leurs chiffres) et les libellés de pays et de région sont ramenés à
+# une forme unique (« ALLEMAGNE  », « allemagne » -> « Allemagne »), sans quoi
+# chaque variante apparaît comme un pays distinct dans les filtres et les
+# comptages.
+#
+# Comme pour les dates, le travail ne porte que sur les valeurs distinctes de
+# chaque bloc : la colonne est factorisée une fois, les libellés inconnus
+# sont ajoutés à une table de correspondance conservée d'un bloc à l'autre,
+# et le résultat est directement une colonne catégorielle.
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Colonnes de libellés normalisées
+LABEL_COLUMNS = ['pays', 'groupe_instructeur_label']
+
+SIRET_COLUMN = 'demandeur_siret'
+
+# SIREN de La Poste, dont les SIRET ne respectent pas la clé de Luhn
+SIREN_LA_POSTE = "356000000"
+
+# Nombre maximal d'exemples conservés dans le rapport
+MAX_EXAMPLES = 10
+
+_SEPARATORS = re.compile(r"[\s\-‐–'’_]+")
+
+
+# Fonction pour calculer la clé de comparaison d'un libellé : sans casse,
+# sans accents et sans différence d'espaces, de tirets ou d'apostrophes
+def label_key(value):
+    value = unicodedata.normalize("NFKD", value.casefold())
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return _SEPARATORS.sub(" ", value).strip()
+
+
+# Fonction pour vérifier des SIRET (chaînes sans espaces) de façon vectorisée.
+# Renvoie un tableau de booléens.
+def siret_valid(values):
+    values = pd.Series(values, dtype=object).astype(str)
+    valid = np.zeros(len(values), dtype=bool)
+    candidates = ((values.str.len() == 14) & values.str.isdigit()).to_numpy()
+    if not candidates.any():
+        return valid
+
+    digits = values[candidates].to_numpy().astype("S14")
+    digits = np.frombuffer(digits.tobytes(), dtype=np.uint8).reshape(-1, 14).astype(np.int64) - 48
+    # En partant de la droite, un chiffre sur deux est doublé : sur 14
+    # chiffres, ce sont les positions paires en partant de la gauche
+    doubled = digits[:, 0::2] * 2
+    doubled -= 9 * (doubled > 9)
+    luhn = (doubled.sum(axis=1) + digits[:, 1::2].sum(axis=1)) % 10 == 0
+    la_poste = (values[candidates].str[:9] == SIREN_LA_POSTE).to_numpy() & (digits.sum(axis=1) % 5 == 0)
+    valid[candidates] = luhn | la_poste
+    return valid
+
+
+# Fonction pour construire une colonne catégorielle à partir des codes d'une
+# factorisation et du libellé retenu pour chaque valeur distincte
+def _categorical(codes, labels, index):
+    present = pd.Series(labels, dtype=object).dropna()
+    categories = pd.Index(present.unique())
+    try:
+        categories = categories.sort_values()
+    except TypeError:
+        # Libellés de types différents (cellules Excel mixtes)
+        pass
+    # Le code -1 (valeur manquante) pointe sur le -1 ajouté en fin de tableau
+    lookup = np.append(categories.get_indexer(pd.Index(labels, dtype=object)), -1)
+    return pd.Series(pd.Categorical.from_codes(lookup[codes], categories=categories), index=index)
+
+
+class QualityCheck:
+    # La table des libellés retenus est conservée d'un bloc à l'autre lors
+    # d'une lecture par blocs, pour que toutes les variantes d'un pays
+    # aboutissent au même libellé
+    def __init__(self):
+        self.siret_invalid = 0
+        self.siret_missing = 0
+        self.normalized = dict.fromkeys(LABEL_COLUMNS, 0)
+        self._invalid_sirets = set()
+        self._variants = {col: {} for col in LABEL_COLUMNS}
+        # clé de comparaison -> libellé retenu, puis valeur brute -> libellé retenu
+        self._canonical = {col: {} for col in LABEL_COLUMNS}
+        self._memo = {col: {} for col in LABEL_COLUMNS}
+
+    # Fonction pour reprendre les libellés déjà retenus (magasin incrémental)
+    def seed(self, df):
+        for col in LABEL_COLUMNS:
+            if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                for label in df[col].cat.categories:
+                    if isinstance(label, str):
+                        self._canonical[col].setdefault(label_key(label), label)
+                        self._memo[col].setdefault(label, label)
+
+    def _learn(self, col, values, counts):
+        canonical, memo = self._canonical[col], self._memo[col]
+        candidates = {}
+        for value, count in zip(values, counts):
+            if not isinstance(value, str):
+                memo[value] = str(value)
+                continue
+            label = " ".join(value.split())
+            if not label:
+                memo[value] = None
+                continue
+            key = label_key(label)
+            if key not in canonical:
+                # Libellé retenu pour une nouvelle clé : de préférence en casse
+                # mixte, sinon le plus fréquent du bloc
+                rank = (label != label.upper() and label != label.lower(), count)
+                if key not in candidates or rank > candidates[key][0]:
+                    candidates[key] = (rank, label)
+            memo[value] = key
+        for key, (_, label) in candidates.items():
+            canonical[key] = label
+        for value in values:
+            key = memo[value]
+            if isinstance(value, str) and key is not None:
+                memo[value] = canonical[key]
+
+    def normalize(self, values, col):
+        codes, uniques = pd.factorize(values)
+        uniques = uniques.to_numpy(dtype=object) if hasattr(uniques, "to_numpy") else np.asarray(uniques, dtype=object)
+        memo = self._memo[col]
+        new = [i for i, value in enumerate(uniques) if value not in memo]
+        if new:
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self._learn(col, uniques[new], counts[new])
+        labels = np.array([memo[value] for value in uniques], dtype=object)
+
+        changed = np.flatnonzero(labels != uniques)
+        if len(changed):
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self.normalized[col] += int(counts[changed].sum())
+            for i in changed:
+                if labels[i] is not None:
+                    self._variants[col].setdefault(labels[i], set()).add(uniques[i])
+        return _categorical(codes, labels, values.index)
+
+    def check_sirets(self, values):
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype=object).astype(str).str.replace(r"\s+", "", regex=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+        blank = (uniques == "").to_numpy()
+        invalid = ~siret_valid(uniques) & ~blank
+        self.siret_missing += int((codes < 0).sum() + counts[blank].sum())
+        self.siret_invalid += int(counts[invalid].sum())
+        self._invalid_sirets.update(uniques[invalid])
+
+        labels = uniques.where(~blank, None).to_numpy(dtype=object)
+        return _categorical(codes, labels, values.index)
+
+    # Fonction pour contrôler un bloc : colonnes de libellés normalisées et
+    # SIRET nettoyés, toutes converties en catégories
+    def apply(self, chunk):
+        columns = {col: self.normalize(chunk[col], col) for col in LABEL_COLUMNS if col in chunk.columns}
+        if SIRET_COLUMN in chunk.columns:
+            columns[SIRET_COLUMN] = self.check_sirets(chunk[SIRET_COLUMN])
+        return chunk.assign(**columns)
+
+    # Rapport compact, sérialisable en JSON
+    def report(self):
+        return {
+            "siret_invalides": self.siret_invalid,
+            "siret_invalides_distincts": len(self._invalid_sirets),
+            "siret_manquants": self.siret_missing,
+            "exemples_siret_invalides": sorted(self._invalid_sirets)[:MAX_EXAMPLES],
+            "libelles_normalises": dict(self.normalized),
+            "variantes": {
+                col: {label: sorted(map(str, values)) for label, values in list(variants.items())[:MAX_EXAMPLES]}
+                for col, variants in self._variants.items() if variants
+            },
+        }
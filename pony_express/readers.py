@@ -0,0 +1,260 @@
+# Lecture rapide des exports CSV et Excel.
+#
+# CSV : le séparateur, l'encodage et le séparateur décimal sont détectés sur
+# les premiers Ko du fichier seulement ; la lecture complète passe ensuite par
+# le moteur C de pandas (ou pyarrow s'il est installé) en ne gardant que les
+# colonnes utilisées par l'application. La lecture par blocs permet de ne
+# conserver en mémoire que les lignes retenues.
+#
+# Excel : le classeur est parcouru ligne à ligne (openpyxl en lecture seule,
+# ou python-calamine s'il est installé) sans construire le modèle objet des
+# cellules ; seules les colonnes utiles, repérées par leur en-tête, sont
+# extraites et converties en colonnes par blocs de lignes.
+import csv
+import os
+import re
+from collections import namedtuple
+from operator import itemgetter
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+try:
+    import python_calamine
+    EXCEL_BACKEND = "calamine"
+except ImportError:
+    python_calamine = None
+    EXCEL_BACKEND = "openpyxl"
+
+# Taille de l'échantillon utilisé pour la détection du format
+SNIFF_BYTES = 64 * 1024
+
+CANDIDATE_SEPARATORS = ";,\t|"
+
+# Colonnes lues dans les exports, en plus de la colonne de date
+BASE_COLUMNS = ["pays", "groupe_instructeur_label", "libelle_etablissement", "demandeur_siret"]
+
+DATE_COLUMNS = {
+    "sortante": "date_depart",
+    "entrante": "date_debut_mobilite_entrante",
+}
+
+CsvFormat = namedtuple("CsvFormat", ["encoding", "sep", "decimal", "header"])
+
+_DECIMAL_COMMA = re.compile(r"^-?\d+,\d+$")
+
+
+# Fonction pour obtenir le nom de la colonne de date d'un type de mobilité
+def date_column(type_mobilite):
+    return DATE_COLUMNS["entrante" if type_mobilite == "entrante" else "sortante"]
+
+
+# Fonction pour obtenir les colonnes utilisées pour un type de mobilité
+def used_columns(type_mobilite):
+    return BASE_COLUMNS + [date_column(type_mobilite)]
+
+
+def _is_path(source):
+    return isinstance(source, (str, bytes)) or hasattr(source, "__fspath__")
+
+
+def _read_head(source, size=SNIFF_BYTES):
+    if _is_path(source):
+        with open(source, "rb") as f:
+            return f.read(size)
+    source.seek(0)
+    head = source.read(size)
+    source.seek(0)
+    return head
+
+
+def _decode_head(head):
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig", head[3:].decode("utf-8", errors="ignore")
+    # L'échantillon peut couper un caractère multi-octets en fin de buffer
+    complete = head[:head.rfind(b"\n") + 1] or head
+    try:
+        return "utf-8", complete.decode("utf-8")
+    except UnicodeDecodeError:
+        # Exports français produits par Excel sous Windows
+        return "cp1252", complete.decode("cp1252", errors="replace")
+
+
+# Fonction pour détecter le format d'un fichier CSV à partir de son début
+def sniff_csv(head):
+    encoding, text = _decode_head(head)
+    lines = text.splitlines()
+    sample = "\n".join(lines[:50])
+    header_line = lines[0] if lines else ""
+
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=CANDIDATE_SEPARATORS).delimiter
+    except csv.Error:
+        # Repli : le séparateur le plus fréquent dans l'en-tête
+        sep = max(CANDIDATE_SEPARATORS, key=header_line.count)
+
+    rows = list(csv.reader(lines[:50], delimiter=sep))
+    header = rows[0] if rows else []
+
+    # Une virgule décimale n'est possible que si la virgule ne sépare pas les champs
+    decimal = "."
+    if sep != ",":
+        values = [value.strip() for row in rows[1:] for value in row]
+        if any(_DECIMAL_COMMA.match(value) for value in values):
+            decimal = ","
+
+    return CsvFormat(encoding, sep, decimal, header)
+
+
+def _csv_reader(source, fmt, usecols, encoding, engine, chunksize=None):
+    if not _is_path(source):
+        source.seek(0)
+    return pd.read_csv(
+        source,
+        sep=fmt.sep,
+        encoding=encoding,
+        decimal=fmt.decimal,
+        usecols=usecols,
+        dtype=str,
+        engine=engine,
+        chunksize=chunksize,
+    )
+
+
+def _projection(source, columns):
+    fmt = sniff_csv(_read_head(source))
+    wanted = set(columns)
+    usecols = [col for col in fmt.header if col.strip() in wanted]
+    return fmt, usecols
+
+
+# Fonction pour lire un export CSV en ne gardant que les colonnes demandées
+def read_csv_fast(source, columns, engine=None):
+    fmt, usecols = _projection(source, columns)
+    engine = engine or CSV_ENGINE
+
+    try:
+        df = _csv_reader(source, fmt, usecols, fmt.encoding, engine)
+    except (UnicodeDecodeError, ValueError):
+        # Caractère non UTF-8 au-delà de l'échantillon analysé
+        # (pyarrow signale l'erreur d'encodage par une ValueError)
+        if fmt.encoding == "cp1252":
+            raise
+        df = _csv_reader(source, fmt, usecols, "cp1252", engine)
+
+    df.columns = [col.strip() for col in df.columns]
+    return df
+
+
+# Fonction pour lire un export CSV par blocs de lignes.
+# Renvoie les colonnes trouvées dans l'en-tête et un itérateur de DataFrames ;
+# seul le moteur C de pandas sait lire par blocs.
+def read_csv_chunks(source, columns, chunksize):
+    fmt, usecols = _projection(source, columns)
+
+    def _chunks():
+        yielded = 0
+        try:
+            for chunk in _csv_reader(source, fmt, usecols, fmt.encoding, "c", chunksize):
+                chunk.columns = [col.strip() for col in chunk.columns]
+                yielded += len(chunk)
+                yield chunk
+        except UnicodeDecodeError:
+            if fmt.encoding == "cp1252":
+                raise
+            # Reprise en cp1252 en sautant les lignes déjà transmises
+            skip = yielded
+            for chunk in _csv_reader(source, fmt, usecols, "cp1252", "c", chunksize):
+                chunk.columns = [col.strip() for col in chunk.columns]
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                yield chunk.iloc[skip:]
+                skip = 0
+
+    return [col.strip() for col in usecols], _chunks()
+
+
+# Texte d'une cellule Excel : les SIRET saisis comme nombres gardent leurs
+# chiffres, les dates et les cellules vides sont laissées telles quelles
+def _cell_value(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else str(value)
+    return value
+
+
+def _excel_rows(source, extension, backend):
+    if not _is_path(source):
+        source.seek(0)
+
+    if backend == "calamine" or extension == ".xls":
+        if python_calamine is not None:
+            workbook = python_calamine.CalamineWorkbook.from_object(source)
+            yield from workbook.get_sheet_by_index(0).iter_rows()
+            return
+        # Repli sans calamine pour l'ancien format : xlrd via pandas
+        df = pd.read_excel(source, header=None, dtype=object)
+        yield from df.itertuples(index=False, name=None)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # Certaines applications écrivent des dimensions de feuille erronées
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+# Fonction pour lire la première feuille d'un classeur par blocs de lignes,
+# en ne gardant que les colonnes demandées. Renvoie les colonnes trouvées dans
+# l'en-tête et un itérateur de DataFrames.
+def read_excel_chunks(source, name, columns, chunksize=None, backend=None):
+    extension = os.path.splitext(name)[1].lower()
+    rows = _excel_rows(source, extension, backend or EXCEL_BACKEND)
+    header = next(rows, None) or []
+
+    wanted = set(columns)
+    positions = [i for i, col in enumerate(header) if col is not None and str(col).strip() in wanted]
+    names = [str(header[i]).strip() for i in positions]
+    if not positions:
+        rows.close()
+        return names, iter([])
+
+    width = len(header)
+    pick = itemgetter(*positions) if len(positions) > 1 else (lambda row: (row[positions[0]],))
+
+    def _to_frame(batch):
+        data = {col: [_cell_value(v) for v in values] for col, values in zip(names, zip(*batch))}
+        return pd.DataFrame(data, columns=names)
+
+    def _chunks():
+        batch = []
+        for row in rows:
+            # Lignes plus courtes que l'en-tête (cellules de fin vides)
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            values = pick(row)
+            if all(v is None or v == "" for v in values):
+                continue
+            batch.append(values)
+            if chunksize and len(batch) >= chunksize:
+                yield _to_frame(batch)
+                batch = []
+        if batch:
+            yield _to_frame(batch)
+
+    return names, _chunks()
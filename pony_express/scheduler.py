@@ -0,0 +1,65 @@
+# Analyse en parallèle des fichiers téléchargés.
+#
+# Les fichiers en attente (un par onglet) sont confiés à un pool de threads
+# dès le début de l'exécution du script : l'analyse CSV de pandas libère le
+# GIL pendant la tokenisation, et les résultats restent dans le processus,
+# partagés avec le magasin de jeux de données. Chaque tâche publie sa
+# progression, que l'interface affiche pendant l'attente.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IngestJob:
+    def __init__(self, job_id, label):
+        self.job_id = job_id
+        self.label = label
+        self.progress = 0.0
+        self.future = None
+        self.finished_at = None
+
+    def set_progress(self, fraction):
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class IngestScheduler:
+    def __init__(self, max_workers=4, retention_seconds=600):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    # Fonction pour lancer une analyse ; une tâche déjà connue sous le même
+    # identifiant est renvoyée telle quelle. La fonction reçoit un paramètre
+    # progress à appeler avec la fraction déjà traitée.
+    def submit(self, job_id, label, fn, *args, **kwargs):
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+
+            job = IngestJob(job_id, label)
+            job.future = self._executor.submit(fn, *args, progress=job.set_progress, **kwargs)
+            job.future.add_done_callback(lambda _: setattr(job, "finished_at", time.monotonic()))
+            self._jobs[job_id] = job
+            return job
+
+    # Fonction pour oublier une tâche dont le résultat a été récupéré
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    # Les résultats jamais récupérés (session fermée entre-temps) sont oubliés
+    # après le délai de rétention
+    def _prune(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.retention_seconds:
+                del self._jobs[job_id]
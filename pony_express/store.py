@@ -0,0 +1,341 @@
+# Magasin incrémental d'un onglet : les exports cumulatifs rechargés chaque
+# semaine ne diffèrent du chargement précédent que de quelques centaines de
+# dossiers.
+#
+# Chaque ligne lue reçoit une clé stable (identifiant de dossier s'il est
+# exporté et renseigné, sinon SIRET + date et rang d'occurrence) et une empreinte de son
+# contenu brut, toutes deux hachées sur 64 bits. Seules les lignes dont la clé est nouvelle ou dont l'empreinte
+# a changé passent par la conversion des dates et les catégories ; elles sont
+# ajoutées ou remplacées dans le DataFrame, et l'index des filtres et le cube
+# de comptages sont mis à jour pour les seules années touchées. Le rapport
+# qualité d'une fusion ne porte lui aussi que sur ces lignes.
+#
+# Sans identifiant de dossier, une ligne dont le SIRET ou la date change
+# est vue comme un nouveau dossier : l'ancienne version reste dans le magasin.
+#
+# Les sessions lisent un instantané (DataFrame, rapport, index et cube) publié
+# d'un bloc à la fin de chaque fusion : la lecture ne prend pas de verrou et
+# n'attend pas la fusion en cours, qui porte sur des copies.
+#
+# Le magasin est écrit sur disque après chaque fusion (même format que le
+# cache des fichiers) pour survivre aux redémarrages du serveur.
+import copy
+import json
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pony_express.cache import CACHE_VERSION, DISK_FORMAT
+from pony_express.cube import CountsCube
+from pony_express.dates import DateParser
+from pony_express.index import INDEX_COLUMNS, QueryIndex
+from pony_express.profiling import stage
+from pony_express.ingest import (
+    DEFAULT_MIN_YEAR, concat_chunks, finish_frame, prepare_chunk, read_chunks, read_fraction, require_columns,
+    source_size,
+)
+from pony_express.quality import QualityCheck
+from pony_express.readers import date_column, used_columns
+
+# Colonnes d'identifiant de dossier reconnues, par ordre de préférence
+KEY_COLUMNS = ["dossier_id", "numero_dossier"]
+
+_KEY = "_cle"
+
+# État du magasin vu par une session : mêmes attributs qu'un jeu de données
+# chargé, plus l'index et le cube tenus à jour par le magasin
+StoreSnapshot = namedtuple("StoreSnapshot", ["key", "df", "report", "index", "cube"])
+
+
+def _hash_rows(frame):
+    return pd.util.hash_pandas_object(frame, index=False, categorize=False).to_numpy()
+
+
+def _uint64_series(values=(), index=()):
+    return pd.Series(np.asarray(values, dtype=np.uint64), index=pd.Index(np.asarray(index, dtype=np.uint64)))
+
+
+# Fonction pour remplacer les lignes positions de df par les premières lignes
+# de rows et ajouter les suivantes. Les catégories existantes sont conservées
+# et les nouvelles valeurs ajoutées à la fin : les codes des lignes déjà
+# chargées restent valides, sans recodage de toute la colonne.
+def _splice(df, rows, positions):
+    n = len(df)
+    order = np.arange(n)
+    order[positions] = n + np.arange(len(positions))
+    order = np.concatenate([order, n + np.arange(len(positions), len(rows))])
+    columns = {}
+    for col in df.columns:
+        current, new = df[col], rows[col]
+        if isinstance(current.dtype, pd.CategoricalDtype):
+            categories = current.cat.categories
+            added = pd.Index(new.dropna().unique()).difference(categories)
+            if len(added):
+                categories = categories.append(added.astype(categories.dtype))
+            codes = np.concatenate([current.cat.codes.to_numpy(), categories.get_indexer(new.astype(object))])
+            columns[col] = pd.Categorical.from_codes(codes[order], categories=categories)
+        else:
+            columns[col] = pd.concat([current, new], ignore_index=True).take(order).reset_index(drop=True)
+    return pd.DataFrame(columns)
+
+
+class MobilityStore:
+    def __init__(self, store_dir, name, type_mobilite="sortante", min_year=DEFAULT_MIN_YEAR):
+        self.store_dir = store_dir
+        self.name = name
+        self.type_mobilite = type_mobilite
+        self.min_year = min_year
+        self.version = 0
+        self.report = {}
+        self.df = None
+        self.index = None
+        self.cube = None
+        # Clés des lignes de df, dans l'ordre des positions
+        self._keys = pd.Index([], dtype=np.uint64)
+        # Empreinte de chaque ligne déjà lue, y compris celles écartées par
+        # l'année minimale, pour ne pas les analyser à nouveau
+        self._seen = _uint64_series()
+        # Instantané publié, remplacé d'un bloc après chaque fusion
+        self._snapshot = None
+        # Les fusions sont exécutées l'une après l'autre
+        self._merge_lock = threading.Lock()
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+            self._load()
+
+    def __len__(self):
+        return 0 if self.df is None else len(self.df)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def _publish(self):
+        if self.df is not None:
+            key = f"magasin:{self.name}:{CACHE_VERSION}:{self.version}"
+            self._snapshot = StoreSnapshot(key, self.df, self.report, self.index, self.cube)
+
+    # Fonction pour calculer la clé stable de chaque ligne d'un bloc brut.
+    # occurrences compte les clés de repli déjà vues dans le fichier en cours.
+    def _row_keys(self, chunk, occurrences):
+        keys = np.zeros(len(chunk), dtype=np.uint64)
+        blank = np.ones(len(chunk), dtype=bool)
+        for col in KEY_COLUMNS:
+            if col in chunk.columns:
+                ids = chunk[col].str.strip()
+                blank = (ids.isna() | (ids == "")).to_numpy()
+                keys[~blank] = _hash_rows(ids[~blank].to_frame())
+                break
+
+        # Lignes sans identifiant (colonne absente ou cellule vide) : clé de repli
+        if blank.any():
+            keys[blank], occurrences = self._fallback_keys(chunk[blank], occurrences)
+        return keys, occurrences
+
+    # Clé de repli : SIRET + date, numérotés pour distinguer les dossiers
+    # d'un même établissement partis le même jour
+    def _fallback_keys(self, chunk, occurrences):
+        parts = [col for col in ("demandeur_siret", date_column(self.type_mobilite)) if col in chunk.columns]
+        base = pd.Series(_hash_rows(chunk[parts]))
+        rank = base.groupby(base, sort=False).cumcount().to_numpy().copy()
+        rank += occurrences.reindex(base).fillna(0).to_numpy(dtype=np.int64)
+        occurrences = occurrences.add(base.value_counts(), fill_value=0)
+        return _hash_rows(pd.DataFrame({"base": base, "rang": rank})), occurrences
+
+    # Fonction pour fusionner un export (complet ou partiel) dans le magasin.
+    # Renvoie le rapport de fusion ; progress reçoit la fraction du fichier lue
+    # et trace, comme pour ingest(), la durée de chaque étape (lecture,
+    # empreintes, préparation des lignes modifiées, fusion).
+    def merge(self, source, name, chunksize=None, progress=None, trace=None):
+        columns_wanted = used_columns(self.type_mobilite)
+        date_col = date_column(self.type_mobilite)
+        size = source_size(source) if progress else None
+
+        with self._merge_lock:
+            with stage(trace, "lecture"):
+                columns, chunks = read_chunks(source, name, columns_wanted + KEY_COLUMNS, chunksize)
+            require_columns(columns, self.type_mobilite)
+            data_columns = [col for col in columns if col in columns_wanted]
+
+            date_parser = DateParser()
+            # Les variantes des libellés déjà présents aboutissent au même libellé
+            quality = QualityCheck()
+            if self.df is not None:
+                quality.seed(self.df)
+            occurrences = pd.Series(dtype=np.int64)
+            seen_keys = self._seen.index
+            seen_hashes = self._seen.to_numpy()
+            rows_read = 0
+            fresh_keys, fresh_hashes, parts = [], [], []
+            while True:
+                with stage(trace, "lecture") as record:
+                    chunk = next(chunks, None)
+                    record["lignes_sortie"] = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+                rows_read += len(chunk)
+                with stage(trace, "empreintes", len(chunk)):
+                    keys, occurrences = self._row_keys(chunk, occurrences)
+                    hashes = _hash_rows(chunk[data_columns])
+
+                # Lignes nouvelles ou dont le contenu a changé : seules
+                # celles-ci sont converties, bloc par bloc
+                known = seen_keys.get_indexer(keys)
+                changed = known < 0
+                changed[~changed] = seen_hashes[known[~changed]] != hashes[~changed]
+                if changed.any():
+                    fresh_keys.append(keys[changed])
+                    fresh_hashes.append(hashes[changed])
+                    part = chunk.loc[changed, data_columns].assign(**{_KEY: keys[changed]})
+                    part = prepare_chunk(part, date_col, self.min_year, date_parser, trace, quality)
+                    if len(part):
+                        parts.append(part)
+                if progress:
+                    fraction = read_fraction(source, size)
+                    if fraction is not None:
+                        progress(fraction)
+
+            report = {
+                "lignes_lues": rows_read,
+                "lignes_nouvelles": 0,
+                "lignes_modifiees": 0,
+                "format_date": date_parser.fmt or self.report.get("format_date"),
+                "dates_invalides": date_parser.invalid,
+                "qualite": quality.report(),
+            }
+            if fresh_keys:
+                with stage(trace, "fusion", sum(len(part) for part in parts)) as record:
+                    report.update(self._apply(np.concatenate(fresh_keys), np.concatenate(fresh_hashes), parts,
+                                              date_col, data_columns))
+                    record["lignes_sortie"] = len(self)
+                self.version += 1
+            report["lignes_inchangees"] = rows_read - report["lignes_nouvelles"] - report["lignes_modifiees"]
+            report["lignes_conservees"] = len(self)
+            self.report = report
+            self._publish()
+            if fresh_keys:
+                self._save()
+            if progress:
+                progress(1.0)
+            return report
+
+    def _apply(self, keys, hashes, parts, date_col, columns):
+        # Une clé présente plusieurs fois dans le fichier : la dernière l'emporte
+        last = ~pd.Series(keys).duplicated(keep="last").to_numpy()
+        keys, hashes = keys[last], hashes[last]
+
+        # Empreintes : mise à jour des clés connues, ajout des nouvelles
+        known = self._seen.index.get_indexer(keys)
+        seen = self._seen.to_numpy().copy()
+        seen[known[known >= 0]] = hashes[known >= 0]
+        seen = pd.concat([
+            _uint64_series(seen, self._seen.index),
+            _uint64_series(hashes[known < 0], keys[known < 0]),
+        ])
+        stats = {"lignes_nouvelles": int((known < 0).sum()), "lignes_modifiees": int((known >= 0).sum())}
+
+        if parts:
+            prepared = concat_chunks(parts).drop_duplicates(_KEY, keep="last").reset_index(drop=True)
+        else:
+            # Toutes les lignes nouvelles ou modifiées sont antérieures à l'année minimale
+            prepared = prepare_chunk(pd.DataFrame(columns=columns + [_KEY]), date_col, self.min_year, DateParser())
+        prepared = finish_frame(prepared)
+        kept_keys = prepared.pop(_KEY).to_numpy(dtype=np.uint64)
+
+        if self.df is None:
+            df, row_keys = prepared, pd.Index(kept_keys, dtype=np.uint64)
+            index, cube = QueryIndex(df), CountsCube(df)
+        else:
+            # Lignes modifiées sorties de la période (date antérieure à l'année
+            # minimale) : elles quittent le DataFrame
+            positions = self._keys.get_indexer(keys)
+            target = self._keys.get_indexer(kept_keys)
+            dropped = np.setdiff1d(positions[positions >= 0], target)
+            updated = target >= 0
+
+            prepared = prepared[list(self.df.columns)]
+            n = len(self.df)
+            previous = self.df.iloc[target[updated]][INDEX_COLUMNS]
+            rows = pd.concat([prepared[updated], prepared[~updated]], ignore_index=True)
+            df = finish_frame(_splice(self.df, rows, target[updated]))
+            row_keys = self._keys.append(pd.Index(kept_keys[~updated], dtype=np.uint64))
+
+            if len(dropped):
+                # Cas rare : les positions changent, on reconstruit
+                keep = np.setdiff1d(np.arange(len(df)), dropped)
+                df = df.take(keep).reset_index(drop=True)
+                row_keys = row_keys.take(keep)
+                index, cube = QueryIndex(df), CountsCube(df)
+            else:
+                # Copie sur écriture : les instantanés déjà remis gardent leur
+                # DataFrame avec l'index et le cube qui lui correspondent
+                index, cube = self.index.copy(), copy.copy(self.cube)
+                years = index.remove(previous, target[updated])
+                years |= index.add(df, np.concatenate([target[updated], np.arange(n, len(df))]))
+                cube.refresh(df, years)
+
+        # L'état (empreintes comprises) n'est modifié qu'une fois la fusion réussie
+        self.df, self._keys, self.index, self.cube, self._seen = df, row_keys, index, cube, seen
+        return stats
+
+    def _rebuild(self):
+        self.index = QueryIndex(self.df)
+        self.cube = CountsCube(self.df)
+
+    def _path(self, suffix):
+        return os.path.join(self.store_dir, f"{self.name}{suffix}")
+
+    def _load(self):
+        try:
+            with open(self._path(".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("cache_version") != CACHE_VERSION or meta.get("type_mobilite") != self.type_mobilite \
+                    or meta.get("annee_min") != self.min_year:
+                return
+            read = pd.read_parquet if DISK_FORMAT == "parquet" else pd.read_pickle
+            df = read(self._path(f".{DISK_FORMAT}"))
+            seen = read(self._path(f"_vus.{DISK_FORMAT}"))
+        except Exception:
+            # Magasin absent ou illisible : on repart d'un magasin vide
+            return
+        self._keys = pd.Index(df.pop(_KEY).to_numpy(dtype=np.uint64))
+        self.df = df
+        self._seen = _uint64_series(seen["empreinte"], seen["cle"])
+        self.version = meta["version"]
+        self.report = meta["rapport"]
+        self._rebuild()
+        self._publish()
+
+    def _save(self):
+        if not self.store_dir:
+            return
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        meta = {
+            "cache_version": CACHE_VERSION,
+            "type_mobilite": self.type_mobilite,
+            "annee_min": self.min_year,
+            "version": self.version,
+            "rapport": self.report,
+        }
+        frames = {
+            f".{DISK_FORMAT}": self.df.assign(**{_KEY: self._keys.to_numpy()}),
+            f"_vus.{DISK_FORMAT}": pd.DataFrame({"cle": self._seen.index.to_numpy(), "empreinte": self._seen.to_numpy()}),
+        }
+        try:
+            for name, frame in frames.items():
+                if DISK_FORMAT == "parquet":
+                    frame.to_parquet(self._path(name) + suffix, index=False)
+                else:
+                    frame.to_pickle(self._path(name) + suffix)
+            # Les métadonnées sont écrites en dernier : elles valident les fichiers
+            with open(self._path(".json") + suffix, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            for name in list(frames) + [".json"]:
+                os.replace(self._path(name) + suffix, self._path(name))
+        except Exception:
+            # Comme pour le cache : l'écriture disque est une optimisation
+            for name in list(frames) + [".json"]:
+                if os.path.exists(self._path(name) + suffix):
+                    os.remove(self._path(name) + suffix)
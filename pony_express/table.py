@@ -0,0 +1,67 @@
+# Vue fenêtrée des résultats filtrés.
+#
+# La recherche et le tri sont faits côté serveur sur les positions des lignes,
+# et seule la page affichée est extraite et envoyée au navigateur. Pour les
+# colonnes catégorielles, la recherche et le tri ne portent que sur les
+# libellés distincts présents dans la sélection, puis sont appliqués aux codes.
+import math
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZES = [50, 100, 250, 500]
+
+# Colonnes (libellés affichés) sur lesquelles porte la recherche
+SEARCH_COLUMNS = ["Etablissement", "SIRET"]
+
+
+def _labels(values):
+    # Libellés distincts présents et code de chaque ligne vers ces libellés
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        used = np.unique(codes[codes >= 0])
+        lookup = np.full(len(values.cat.categories), -1, dtype=np.int64)
+        lookup[used] = np.arange(len(used))
+        return pd.Index(values.cat.categories[used]).astype(str), np.where(codes >= 0, lookup[codes], -1)
+    codes, uniques = pd.factorize(values)
+    return pd.Index(uniques).astype(str), codes
+
+
+# Fonction pour obtenir les positions des lignes dont une des colonnes
+# contient le texte recherché (sans tenir compte de la casse)
+def matching_rows(df, query, columns=SEARCH_COLUMNS):
+    query = query.strip().lower()
+    if not query:
+        return np.arange(len(df))
+    mask = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        if col not in df.columns:
+            continue
+        labels, codes = _labels(df[col])
+        matches = np.flatnonzero(labels.str.lower().str.contains(query, regex=False))
+        mask |= np.isin(codes, matches)
+    return np.flatnonzero(mask)
+
+
+# Fonction pour trier des positions selon une colonne. Tri stable : à valeur
+# égale, l'ordre du fichier est conservé ; les valeurs manquantes sont à la fin.
+def sorted_rows(df, positions, column=None, descending=False):
+    if column is None or not len(positions):
+        return positions
+    labels, codes = _labels(df[column].iloc[positions])
+    # Rang alphabétique de chaque libellé distinct
+    ranks = np.empty(len(labels), dtype=np.int64)
+    ranks[np.argsort(labels.to_numpy(dtype=object), kind="stable")] = np.arange(len(labels))
+    missing = codes < 0
+    keys = np.where(missing, 0, ranks[np.where(missing, 0, codes)]) if len(labels) else np.zeros(len(codes), dtype=np.int64)
+    if descending:
+        keys = -keys
+    return positions[np.lexsort((keys, missing))]
+
+
+# Nombre de pages et bornes [début, fin) de la page demandée (numérotée à partir de 1)
+def page_bounds(total, page, page_size):
+    pages = max(1, math.ceil(total / page_size))
+    page = min(max(1, page), pages)
+    start = (page - 1) * page_size
+    return pages, start, min(start + page_size, total)
@@ -0,0 +1,47 @@
+import os
+
+import pandas as pd
+
+from pony_express.cache import DISK_FORMAT, DataFrameCache, content_key
+
+
+def _frame():
+    return pd.DataFrame({"pays": ["Espagne"] * 1000, "annee": [2024] * 1000})
+
+
+def _disk_keys(cache_dir):
+    return {os.path.splitext(name)[0] for name in os.listdir(cache_dir) if name.endswith(f".{DISK_FORMAT}")}
+
+
+def _age(cache_dir, key, mtime):
+    os.utime(os.path.join(cache_dir, f"{key}.{DISK_FORMAT}"), (mtime, mtime))
+
+
+def test_disk_cache_stays_under_budget(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    k0, k1, k2, k3 = (content_key(str(i).encode()) for i in range(4))
+    DataFrameCache(max_bytes=0, cache_dir=cache_dir).put(k0, _frame())
+    entry_size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+    # Budget de deux entrées et demie : la plus ancienne est supprimée
+    cache = DataFrameCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=int(entry_size * 2.5))
+    _age(cache_dir, k0, 1)
+    cache.put(k1, _frame())
+    _age(cache_dir, k1, 2)
+    cache.put(k2, _frame())
+    assert _disk_keys(cache_dir) == {k1, k2}
+
+    # Une entrée relue depuis le disque redevient la plus récente
+    _age(cache_dir, k2, 3)
+    assert cache.get(k1) is not None
+    cache.put(k3, _frame())
+    assert _disk_keys(cache_dir) == {k1, k3}
+
+
+def test_disk_cache_without_budget_keeps_everything(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = DataFrameCache(max_bytes=0, cache_dir=cache_dir)
+    keys = {content_key(str(i).encode()) for i in range(3)}
+    for key in keys:
+        cache.put(key, _frame())
+    assert _disk_keys(cache_dir) == keys
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from pony_express.quality import QualityCheck, siret_valid
+
+
+def test_siret_valid():
+    assert siret_valid(["73282932000074"]).tolist() == [True]
+    # Mauvais chiffre de contrôle
+    assert siret_valid(["73282932000075"]).tolist() == [False]
+    # La Poste : clé de Luhn fausse, mais somme des chiffres multiple de 5
+    assert siret_valid(["35600000000001", "35600000000048", "35600000000002"]).tolist() == [True, True, False]
+
+
+def test_siret_valid_rejects_malformed_values():
+    values = ["7328293200007", "732829320000740", "7328293200007A", "732 829 320 00074", "", None]
+    assert not siret_valid(values).any()
+
+
+def test_normalize_merges_variants_across_chunks():
+    quality = QualityCheck()
+    first = quality.normalize(pd.Series(["Allemagne", "ALLEMAGNE ", "allemagne", "Côte d'Ivoire"]), "pays")
+    second = quality.normalize(pd.Series(["  allemagne", "COTE D IVOIRE", "côte d’ivoire", None]), "pays")
+
+    assert first.tolist() == ["Allemagne", "Allemagne", "Allemagne", "Côte d'Ivoire"]
+    assert second.iloc[:3].tolist() == ["Allemagne", "Côte d'Ivoire", "Côte d'Ivoire"]
+    assert pd.isna(second.iloc[3])
+    assert list(second.cat.categories) == ["Allemagne", "Côte d'Ivoire"]
+    assert quality.report()["libelles_normalises"]["pays"] == 5
+
+
+def test_normalize_keeps_seeded_labels():
+    quality = QualityCheck()
+    quality.seed(pd.DataFrame({"pays": pd.Categorical(["Espagne"])}))
+    assert quality.normalize(pd.Series(["ESPAGNE", "espagne"]), "pays").tolist() == ["Espagne", "Espagne"]
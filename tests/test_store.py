@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from pony_express.cube import CountsCube
+from pony_express.index import QueryIndex
+from pony_express.ingest import ingest
+from pony_express.store import MobilityStore
+
+PAYS = ["Allemagne", "Espagne", "Italie"]
+REGIONS = ["Bretagne", "Grand Est", "Normandie"]
+
+
+def _export(path, rows, start=0):
+    ids = np.arange(start, start + rows)
+    pd.DataFrame({
+        "dossier_id": ids,
+        "pays": [PAYS[i % len(PAYS)] for i in ids],
+        "groupe_instructeur_label": [REGIONS[i // 3 % len(REGIONS)] for i in ids],
+        "date_depart": [f"{1 + i % 28:02d}/{1 + i % 12:02d}/{2023 + i % 2}" for i in ids],
+        "libelle_etablissement": [f"Lycée {i % 7}" for i in ids],
+        "demandeur_siret": ["35600000000048"] * rows,
+    }).to_csv(path, sep=";", index=False)
+    return path
+
+
+def _sorted(df):
+    return df.astype(str).sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_snapshot_survives_later_merge(tmp_path):
+    store = MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023)
+    store.merge(_export(tmp_path / "v1.csv", 300), "v1.csv")
+    old = store.snapshot()
+    old_rows = {year: old.index.select(old.df, year, PAYS) for year in old.index.years}
+
+    # Export cumulatif : mêmes dossiers, quelques pays modifiés, et de nouveaux dossiers
+    _export(tmp_path / "v2.csv", 400)
+    v2 = pd.read_csv(tmp_path / "v2.csv", sep=";", dtype=str)
+    v2.loc[:9, "pays"] = "Italie"
+    v2.to_csv(tmp_path / "v2.csv", sep=";", index=False)
+    report = store.merge(str(tmp_path / "v2.csv"), "v2.csv")
+    assert report["lignes_nouvelles"] == 100
+
+    # L'instantané pris avant la fusion est inchangé
+    for year, rows in old_rows.items():
+        assert old.index.select(old.df, year, PAYS).equals(rows)
+
+    # Le nouvel instantané correspond à un chargement complet du même fichier
+    new = store.snapshot()
+    ref, _ = ingest(str(tmp_path / "v2.csv"), "v2.csv", min_year=2023)
+    ref_index = QueryIndex(ref)
+    assert new.index.years == ref_index.years
+    for year in ref_index.years:
+        assert new.index.countries(year) == ref_index.countries(year)
+        for region in [None] + ref_index.regions(year, PAYS):
+            assert _sorted(new.index.select(new.df, year, PAYS, region)).equals(
+                _sorted(ref_index.select(ref, year, PAYS, region)))
+        assert new.cube.year_totals(year) == CountsCube(ref).year_totals(year)
+    for year in old.index.years:
+        assert old.cube.year_totals(year) == CountsCube(old.df).year_totals(year)
+
+
+def _rows(path, rows):
+    pd.DataFrame(rows, columns=[
+        "dossier_id", "pays", "groupe_instructeur_label", "date_depart", "libelle_etablissement", "demandeur_siret",
+    ]).to_csv(path, sep=";", index=False)
+    return str(path)
+
+
+def test_merge_rows_before_min_year(tmp_path):
+    store = MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023)
+    store.merge(_rows(tmp_path / "v1.csv", [["1", "Espagne", "Bretagne", "02/03/2024", "Lycée 1", "35600000000048"]]), "v1.csv")
+
+    # Delta ne contenant qu'un dossier antérieur à l'année minimale
+    report = store.merge(_rows(tmp_path / "v2.csv", [["2", "Italie", "Bretagne", "02/03/2019", "Lycée 2", "35600000000048"]]),
+                         "v2.csv")
+    assert report["lignes_nouvelles"] == 1
+    assert len(store.snapshot().df) == 1
+
+    report = store.merge(_rows(tmp_path / "v3.csv", [["3", "Italie", "Normandie", "05/06/2024", "Lycée 3", "35600000000048"]]),
+                         "v3.csv")
+    assert report["lignes_nouvelles"] == 1
+    snapshot = store.snapshot()
+    assert snapshot.index.countries(2024) == ["Espagne", "Italie"]
+
+
+def test_merge_rows_before_min_year_into_empty_store(tmp_path):
+    store = MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023)
+    report = store.merge(_rows(tmp_path / "v1.csv", [["1", "Italie", "Bretagne", "02/03/2019", "Lycée 1", "35600000000048"]]),
+                         "v1.csv")
+    assert report["lignes_conservees"] == 0
+    assert store.snapshot().index.years == []
+
+    # Le magasin reste utilisable
+    report = store.merge(_rows(tmp_path / "v2.csv", [
+        ["1", "Italie", "Bretagne", "02/03/2019", "Lycée 1", "35600000000048"],
+        ["2", "Espagne", "Bretagne", "02/03/2024", "Lycée 2", "35600000000048"],
+    ]), "v2.csv")
+    assert report["lignes_inchangees"] == 1 and report["lignes_nouvelles"] == 1
+    assert len(store.snapshot().df) == 1
+    assert len(MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023).snapshot().df) == 1
+
+
+def test_rows_without_dossier_id_are_kept(tmp_path):
+    path = _rows(tmp_path / "v1.csv", [
+        ["1", "Espagne", "Bretagne", "02/03/2024", "Lycée 1", "35600000000048"],
+        ["", "Espagne", "Bretagne", "02/03/2024", "Lycée 1", "35600000000048"],
+        ["", "Italie", "Normandie", "04/05/2024", "Lycée 2", "35600000000048"],
+        ["", "Italie", "Normandie", "04/05/2024", "Lycée 2", "35600000000049"],
+    ])
+    store = MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023)
+    report = store.merge(path, "v1.csv")
+    ref, _ = ingest(path, "v1.csv", min_year=2023)
+    assert report["lignes_nouvelles"] == 4
+    assert len(store.snapshot().df) == len(ref) == 4
+
+    report = store.merge(path, "v1.csv")
+    assert report["lignes_inchangees"] == 4
+    assert len(store.snapshot().df) == 4
+
+
+def test_snapshot_does_not_wait_for_merge(tmp_path):
+    store = MobilityStore(str(tmp_path / "magasin"), "apprenants", min_year=2023)
+    store.merge(_export(tmp_path / "v1.csv", 30), "v1.csv")
+    before = store.snapshot()
+
+    # Pendant une fusion, les sessions lisent le dernier instantané publié
+    with store._merge_lock:
+        assert store.snapshot() is before
+    store.merge(_export(tmp_path / "v2.csv", 60), "v2.csv")
+    assert len(store.snapshot().df) == 60 and len(before.df) == 30